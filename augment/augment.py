@@ -1,55 +1,154 @@
 # This file contain class that does data augmentation.
-from math import factorial
-from random import sample, random, choice, seed
+from itertools import permutations
+from math import log
+from random import Random
 
-from .data import Sentence
+import numpy as np
 
-seed(1704)
+from .data import Augmentation, ConllWriter
+from .rng import BatchedDraws
+
+SEED = 1704
 
 class Augment:
 
     ROOT = "root"
     FLEX = ["nsubj", "obj", "advmod", "iobj", "obl", "xcomp", "acl", "advcl", "ccomp", "case"]
 
-    def __init__(self, corpus):
+    def __init__(self, corpus, seed=SEED):
         """Creates Augment object.
 
         Args:
             corpus (Corpus): Corpus from which position statistics and nonces are estimated.
+            seed (int, optional): Seed of the random number generator. Defaults to SEED.
         """
         self.corpus = corpus
+        self.vocab = corpus.vocab
         self.stats = self.corpus.position_statistics()
+        self.root_log_probs = self._log_prob_table(self.stats[self.ROOT])
+        self.rng = Random(seed)
+        self.generator = np.random.default_rng(seed) # Used by crops and nonces if no numbers were drawn for them.
+        self.batched = BatchedDraws() # Numbers for crops and nonces, drawn for batches of sentences.
+        self.draws = None # Numbers for the next crop or nonce call, see BatchedDraws.sentence.
+        self.nonces = None # Nonce index when there is no corpus, e.g. in a worker process.
+        self.rarity = None # Relation id -> negative log of its relative frequency, computed on first use.
+
+    def __getstate__(self):
+        """Leaves out the corpus when pickled, e.g. when shipped to worker processes.
+        Only the vocabulary and the tables that are estimated from the corpus are kept."""
+        state = self.__dict__.copy()
+        state["nonces"] = self.nonce_index()
+        state["corpus"] = None
+        return state
+
+    def nonce_index(self):
+        """Gets the index of possible replacements for nonce generation."""
+        if self.corpus is None:
+            return self.nonces
+        return self.corpus.nonce_index()
+
+    def seed_chunks(self, seed, key, index, sentence):
+        """Takes the numbers of a sentence for the next call of generate_crops or generate_nonce from its batch.
+
+        Args:
+            seed (int): Global seed.
+            key (str): Key of the augmentation task, see pipeline.task_key.
+            index (int): Position of the sentence in the corpus.
+            sentence (Sentence): Sentence that is augmented next.
+        """
+        self.draws = self.batched.sentence(seed, key, index, len(sentence.chunks))
 
-    def _rotate(self, sentence, flexible):
-        """Rotate a sentence randomly
+    def _chunk_draws(self, sentence):
+        """Gets the numbers for the chunks of a sentence, the ones set by seed_chunks are only used once.
+
+        Returns:
+            np.ndarray: Array of shape (2, n_chunks), see BatchedDraws.sentence.
+        """
+        draws, self.draws = self.draws, None
+        if draws is None or draws.shape[1] != len(sentence.chunks):
+            draws = self.generator.random((2, len(sentence.chunks)))
+        return draws
+
+    def _flexible_positions(self, sentence, flexible):
+        """Finds positions of chunks that are allowed to move.
 
         Args:
             sentence (Sentence): Sentence object that should be rotated.
             flexible (List[str]): List of relations that are considered flexible.
 
         Returns:
-            _Sentence: New Sentence object randomly reordered.
+            List[int]: Indices of flexible chunks in sentence.chunks.
         """
-        chunks = sentence.chunks
-        new_order_dict = {i: c for i, c in enumerate(chunks)}
-        # Filter for flexible chunks
-        flexible_chunks = []
-        for idx, chunk in new_order_dict.items():
-            head = chunk.head
-            relation = sentence.dg.nodes[head]["rel"].split(":")[0] # We ignore further specifications for relations.
+        positions = []
+        for idx, chunk in enumerate(sentence.chunks):
+            relation = sentence.rel(chunk.head).split(":")[0] # We ignore further specifications for relations.
             if relation in flexible:
-                flexible_chunks.append((idx, chunk))
-        old_idx = [idx for idx, _ in flexible_chunks] # Get position in old order.
-        new_idx = sample(old_idx, len(flexible_chunks)) # Randomly sample new positions.
-        for (_, chunk), new_i in zip(flexible_chunks, new_idx): # Assign new position to old chunks.
-            new_order_dict[new_i] = chunk
-        new_order = list(new_order_dict.values())
-        rotated = Sentence.from_new_order(sentence.dg, new_order) # Initiate Sentence object.
-        return rotated
-    
+                positions.append(idx)
+        return positions
+
+    def priority(self, sentence, flexible=None):
+        """Estimates how useful a sentence is for augmentation.
+
+        Sentences with more flexible chunks can be rotated in more ways and
+        sentences with rare relations add more to the training data.
+
+        Args:
+            sentence (Sentence): Sentence that could be augmented.
+            flexible (List[str], optional): List of relations that are flexible. Defaults to None.
+
+        Returns:
+            float: Number of flexible chunks plus the negative log relative frequency of the rarest relation.
+        """
+        if flexible is None:
+            flexible = self.FLEX
+        if self.rarity is None:
+            stats = self.corpus.statistics()
+            self.rarity = {self.vocab.ids.get(rel): log(stats.n_tokens / count) for rel, count in stats.relations.items()}
+        rarity = max((self.rarity.get(rel, 0) for rel in sentence.rels[1:]), default=0)
+        return len(self._flexible_positions(sentence, flexible)) + rarity
+
+    def _permutations(self, positions, max_rotations):
+        """Generates distinct new orders of the flexible chunks.
+
+        If there are few enough permutations, all of them are enumerated,
+        otherwise distinct permutations are sampled randomly.
+
+        Args:
+            positions (List[int]): Indices of flexible chunks.
+            max_rotations (int): Maximum number of permutations to generate.
+
+        Returns:
+            List[Tuple[int]]: For each permutation the chunk index that is moved to each position.
+                The original order is never included.
+        """
+        original = tuple(positions)
+        n_perms = 1 # Number of permutations, counted only until there are more than needed.
+        for i in range(2, len(positions) + 1):
+            n_perms *= i
+            if n_perms - 1 > max_rotations: # There are more new orders than needed, k! is never reached.
+                break
+        else: # All k! - 1 new orders are needed, enumerate all except the original order.
+            return [perm for perm in permutations(positions) if perm != original]
+        perms = dict() # Keeps the order in which they were sampled.
+        while len(perms) < max_rotations:
+            perm = tuple(self.rng.sample(positions, len(positions)))
+            if perm != original:
+                perms[perm] = None
+        return list(perms)
+
+    def _new_order(self, sentence, positions, perm):
+        """Gets chunk indices of sentence in the order after moving flexible chunks."""
+        order = list(range(len(sentence.chunks)))
+        for position, idx in zip(positions, perm): # Assign new position to old chunks.
+            order[position] = idx
+        return order
+
     def generate_rotations(self, sentence, n=3,  informed=False, max_rotations=100, flexible=None):
         """Generate rotations for input sentence.
 
+        Only the order of flexible chunks is changed. Candidates are compared as
+        permutations and only the chosen ones are returned, as lazy views of the sentence.
+
         Args:
             sentence (Sentence): Sentence object to rotate
             n (int, optional): Maximum number of rotations that are outputed. Defaults to 3.
@@ -58,46 +157,71 @@ class Augment:
             flexible (List[str], optional): List of relations that are flexible, i.e. allowed to move. Defaults to None.
 
         Returns:
-            List[Sentence]: List of rotated sentences.
+            List[Augmentation]: List of rotated sentences.
         """
         if flexible is None:
             flexible = self.FLEX
-        new_sents = []
-        poss_rots = factorial(len(sentence.chunks)) # Number of possible permutations
-        n_rotations = min(poss_rots, max_rotations) # Find maxmimum number that can be generated.
-        for _ in range(n_rotations):
-            rot_sent = self._rotate(sentence, flexible=flexible)
-            new_sents.append(rot_sent)
+        positions = self._flexible_positions(sentence, flexible)
         if informed is False:
-            n_samples = min(len(new_sents), n)
-            n_new = sample(new_sents, n_samples)
+            # Every sample is equally good, no need to generate more than n.
+            perms = self._permutations(positions, min(n, max_rotations))
+            orders = [self._new_order(sentence, positions, perm) for perm in perms]
+            orders = self.rng.sample(orders, min(len(orders), n))
         else:
-            pos_stats = self.stats[self.ROOT]
-            sorted_sents = sorted(new_sents, key=lambda x: self._sentence_prob(x, pos_stats))
-            n_new = sorted_sents[:n]
-        return n_new
+            perms = self._permutations(positions, max_rotations)
+            if len(perms) == 0:
+                return []
+            orders = np.tile(np.arange(len(sentence.chunks)), (len(perms), 1))
+            orders[:, positions] = perms
+            scores = self._score_orders(sentence, orders)
+            # Keep the n orders with the lowest probability in ascending order, as the sentences were sorted before.
+            if n < len(scores):
+                best = np.argpartition(scores, n - 1)[:n]
+            else:
+                best = np.arange(len(scores))
+            best = best[np.argsort(scores[best], kind="stable")]
+            orders = orders[best].tolist()
+        return [Augmentation.from_new_order(sentence, [sentence.chunks[i] for i in order]) for order in orders]
 
-    def _sentence_prob(self, sentence, pos_stats):
-        """Estimates probability of sentence according to position statistics.
+    def _log_prob_table(self, pos_stats):
+        """Compiles position statistics into a table of log probabilities.
 
         Args:
-            sentence (Sentence): Sentence object for which probablity should be estimated.
-            pos_stats (dict): Dictionary generated by Corpus.position_statistics()
+            pos_stats (dict): Statistics for the dependents of one label, e.g. self.stats[self.ROOT].
 
         Returns:
-            float: Estimated probability of Sentence.
+            np.ndarray: Array of shape (2, len(self.vocab)), row 0 has the log probabilities of
+                being left of the head, row 1 of being right of it, indexed by relation id.
+                Relations without statistics have log probability 0.
         """
-        p = 1
-        # Iterate over all chunks to from root.
-        for chunk in sentence.chunks: 
-            head_rel = sentence.dg.nodes[chunk.head]["rel"]
-            if head_rel not in pos_stats:
-                continue # This is the same as just assuming 1 as its prob
-            if chunk.head < sentence.root:
-                p *= pos_stats[head_rel]["left"]
-            elif chunk.head > sentence.root:
-                p *= pos_stats[head_rel]["right"]
-        return p
+        table = np.ones((2, len(self.vocab)))
+        for rel, probs in pos_stats.items():
+            rel_id = self.vocab.ids.get(rel)
+            if rel_id is not None:
+                table[:, rel_id] = probs["left"], probs["right"]
+        with np.errstate(divide="ignore"): # Probability 0 becomes -inf.
+            return np.log(table)
+
+    def _score_orders(self, sentence, orders):
+        """Estimates the log probability of new chunk orders according to the position statistics of root dependents.
+
+        Args:
+            sentence (Sentence): Sentence object whose chunks are reordered.
+            orders (np.ndarray): Integer array of shape (n_orders, n_chunks), each row has the chunk indices in a new order.
+
+        Returns:
+            np.ndarray: Log probability of each order.
+        """
+        chunk_rels = np.array([sentence.rels[chunk.head] for chunk in sentence.chunks])
+        if chunk_rels.max() >= self.root_log_probs.shape[1]: # Vocabulary has grown since the table was made.
+            self.root_log_probs = self._log_prob_table(self.stats[self.ROOT])
+        root_idx = next(i for i, chunk in enumerate(sentence.chunks) if chunk.head == sentence.root)
+        rels = chunk_rels[orders]
+        root_position = np.argmax(orders == root_idx, axis=1)[:, None]
+        slots = np.arange(orders.shape[1])
+        left = np.where(slots < root_position, self.root_log_probs[0, rels], 0)
+        right = np.where(slots > root_position, self.root_log_probs[1, rels], 0)
+        return (left + right).sum(axis=1)
 
     def generate_crops(self, sentence, relations=False, p=0.5):
         """Generates cropped sentences.
@@ -108,17 +232,18 @@ class Augment:
             p (float, optional): Probability of each label being removed. Defaults to 0.5.
 
         Returns:
-            List[Sentence]: List of cropped sentences.
+            List[Augmentation]: List of cropped sentences.
         """
         crops = []
-        for chunk in sentence.chunks:
-            head_relation = sentence.dg.nodes[chunk.head]["rel"]
+        keep = self._chunk_draws(sentence)[0] <= p # One decision per chunk, drawn beforehand.
+        for chunk, removed in zip(sentence.chunks, keep.tolist()):
+            if not removed or chunk.head == sentence.root: # Dont delete root!
+                continue
             if relations is not False:
-                if head_relation not in relations:
+                if sentence.rel(chunk.head) not in relations:
                     continue
-            if random() <= p and chunk.head != sentence.root: # Dont delete root!
-                cropped_sent = Sentence.from_removal(sentence.dg, chunk.head)
-                crops.append(cropped_sent)
+            cropped_sent = Augmentation.from_removal(sentence, chunk.head)
+            crops.append(cropped_sent)
         return crops
     
     def generate_nonce(self, sentence, p=0.5, strict=False):
@@ -130,54 +255,49 @@ class Augment:
             strict (bool, optional): Whether or not to only replace by words with the same tag. Defaults to False.
 
         Returns:
-            List[Sentence]: List of Sentences with replacements.
+            List[Augmentation]: List of Sentences with replacements.
         """
         nonces = []
-        nonce_dict = self.corpus.nonce_features() # Possible replacement for each relation.
-        for chunk in sentence.chunks:
-            if random() <= p:
-                chunk_head_rel = sentence.dg.nodes[chunk.head]["rel"]
-                possible_nonces = nonce_dict.get(chunk_head_rel)
-                if possible_nonces is None: # No nonces with same relation label.
+        nonce_index = self.nonce_index() # Possible replacement for each relation, built only once.
+        draws = self._chunk_draws(sentence)
+        for chunk, replaced, choice in zip(sentence.chunks, (draws[0] <= p).tolist(), draws[1].tolist()):
+            if replaced:
+                tag = sentence.tags[chunk.head] if strict is True else None # Only words with same tag.
+                possible_nonces = nonce_index.candidates(sentence.rels[chunk.head], tag)
+                if len(possible_nonces) == 0: # No nonces with same relation label or tag.
                     continue
-                if strict is True: # Filter for words with same tag.
-                    original_tag = sentence.dg.nodes[chunk.head]["tag"]
-                    possible_nonces = self.filter_nonces(original_tag, possible_nonces)
-                if len(possible_nonces) == 0: # No nonces with same tag.
-                    continue
-                random_nonce = choice(list(possible_nonces)) # Sample randomly from nonces.
-                nonce_sent = Sentence.from_replacement(sentence.dg, chunk.head, random_nonce)
+                random_nonce = possible_nonces[int(choice * len(possible_nonces))] # Sample randomly from nonces.
+                nonce_sent = Augmentation.from_replacement(sentence, chunk.head, random_nonce)
                 nonces.append(nonce_sent)
         return nonces
 
-    def filter_nonces(self, original_tag, nonces):
-        """Filter for nonces with same tag."""
-        return [n for n in nonces if dict(n)["tag"] == original_tag]
-    
+    def stream(self, corpus, config, epoch_seed, **kwargs):
+        """Augments a corpus on the fly for one training epoch.
+
+        To run several epochs with the same worker processes, use pipeline.EpochStream directly.
+
+        Args:
+            corpus (Corpus): Sentences that should be augmented, with the same vocabulary as this object.
+            config (dict): Techniques with their parameters, like an experiment in experiments.yaml.
+            epoch_seed (int): Seed of the epoch, every epoch should have its own.
+            **kwargs: Further arguments of EpochStream, e.g. batch_size, output or workers.
+
+        Yields:
+            list: Batches of sentences, see EpochStream.epoch.
+        """
+        from .pipeline import EpochStream # The pipeline module imports this one.
+        with EpochStream(self, corpus, config, **kwargs) as stream:
+            yield from stream.epoch(epoch_seed)
+
     def write(self, sentences, path):
         """Write sentences to file.
 
         Args:
-            sentences (Iterable[Sentence]): Sentences that should be writen to file.
+            sentences (Dict[Sentence, Iterable[Sentence]]): Sentences with their augmentations that should be writen to file.
             path (str): Path of output file.
         
         Returns: None
         """
-        with open(path, "w", encoding="utf-8") as file:
+        with ConllWriter(path) as writer:
             for sent, augmentation in sentences.items():
-                conll_str = sent.dg.to_conll(style=10)
-                file.write(conll_str)
-                file.write("\n")
-                for aug_s in augmentation:
-                    conll_str = aug_s.dg.to_conll(style=10)
-                    file.write(conll_str)
-                    file.write("\n")
-
-
-
-
-
-        
-
-
-        
\ No newline at end of file
+                writer.write(sent, augmentation)
@@ -0,0 +1,154 @@
+# This file contains functions for caching preparsed data next to the input file.
+from hashlib import sha1
+import json
+import os
+import shutil
+
+import numpy as np
+
+CACHE_VERSION = 2
+
+def cache_path(path, kind):
+    """Gets the path of a cache for an input file.
+
+    Args:
+        path (str): Path of the input file.
+        kind (str): Name of the kind of cache, e.g. "columns".
+
+    Returns:
+        str: Path in a hidden directory next to the input file.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, ".cache", "{}.{}".format(name, kind))
+
+def file_hash(path):
+    """Gets the sha1 hash of the content of a file."""
+    digest = sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_signature(path, content_hash=True):
+    """Gets the values that identify a version of a file.
+
+    Args:
+        path (str): Path of the file.
+        content_hash (bool, optional): Whether to hash the content. Defaults to True.
+
+    Returns:
+        dict: Absolute path, size, modification time and, if requested, content hash.
+    """
+    stat = os.stat(path)
+    signature = {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if content_hash:
+        signature["sha1"] = file_hash(path)
+    return signature
+
+def _is_valid(meta, path):
+    """Checks whether a cache with the given meta data belongs to the current version of a file."""
+    if meta.get("version") != CACHE_VERSION:
+        return False
+    signature = file_signature(path, content_hash=False)
+    if meta["path"] != signature["path"] or meta["size"] != signature["size"]:
+        return False
+    if meta["mtime"] == signature["mtime"]:
+        return True
+    return meta["sha1"] == file_hash(path) # Only touched, content is the same.
+
+def save_columns(path, kind, strings, columns, offsets, annotations=None):
+    """Writes columns of integers to a cache next to the input file.
+
+    Each column is stored as a .npy file, so it can be memory-mapped when loaded.
+
+    Args:
+        path (str): Path of the input file the columns were parsed from.
+        kind (str): Name of the kind of cache.
+        strings (List[str]): Strings that the integers in the columns refer to.
+        columns (Dict[str, Sequence[int]]): Columns of equal length.
+        offsets (Sequence[int]): Start of every sentence in the columns, followed by their length.
+        annotations (list, optional): Data of every sentence that can be stored as JSON. Defaults to None.
+    """
+    directory = cache_path(path, kind)
+    tmp_directory = directory + ".tmp" # Written completely before it replaces the old cache.
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+    for name, column in columns.items():
+        np.save(os.path.join(tmp_directory, name + ".npy"), np.asarray(column, dtype=np.int32))
+    np.save(os.path.join(tmp_directory, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_directory, "strings.json"), "w", encoding="utf-8") as file:
+        json.dump(strings, file, ensure_ascii=False)
+    with open(os.path.join(tmp_directory, "annotations.json"), "w", encoding="utf-8") as file:
+        json.dump(annotations, file, ensure_ascii=False)
+    meta = dict(file_signature(path), version=CACHE_VERSION, columns=list(columns))
+    with open(os.path.join(tmp_directory, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(tmp_directory, directory)
+
+def load_columns(path, kind):
+    """Loads columns that were cached for an input file.
+
+    Args:
+        path (str): Path of the input file.
+        kind (str): Name of the kind of cache.
+
+    Returns:
+        Tuple[List[str], Dict[str, np.ndarray], np.ndarray, list]: Strings, read-only memory-mapped columns,
+            offsets and annotations like they were passed to save_columns. None if there is no valid cache.
+    """
+    directory = cache_path(path, kind)
+    try:
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not _is_valid(meta, path):
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    if meta["mtime"] != mtime: # Remember new modification time, so the content is not hashed again.
+        meta["mtime"] = mtime
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+    with open(os.path.join(directory, "strings.json"), encoding="utf-8") as file:
+        strings = json.load(file)
+    columns = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in meta["columns"]}
+    offsets = np.load(os.path.join(directory, "offsets.npy"))
+    with open(os.path.join(directory, "annotations.json"), encoding="utf-8") as file:
+        annotations = json.load(file)
+    return strings, columns, offsets, annotations
+
+def save_json(path, kind, data):
+    """Writes data that can be stored as JSON to a cache next to the input file.
+
+    Args:
+        path (str): Path of the input file the data was computed from.
+        kind (str): Name of the kind of cache.
+        data: Data that can be stored as JSON.
+    """
+    target = cache_path(path, kind)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    meta = dict(file_signature(path), version=CACHE_VERSION)
+    with open(target + ".tmp", "w", encoding="utf-8") as file:
+        json.dump({"meta": meta, "data": data}, file, ensure_ascii=False)
+    os.replace(target + ".tmp", target)
+
+def load_json(path, kind):
+    """Loads data that was cached for an input file with save_json.
+
+    Args:
+        path (str): Path of the input file.
+        kind (str): Name of the kind of cache.
+
+    Returns:
+        Data like it was passed to save_json, None if there is no valid cache.
+    """
+    target = cache_path(path, kind)
+    try:
+        with open(target, encoding="utf-8") as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not _is_valid(cached["meta"], path):
+        return None
+    return cached["data"]
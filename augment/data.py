@@ -1,48 +1,147 @@
 # This file contains classes for handling conll data and dependency trees.
-from copy import  deepcopy
+from array import array
+import gzip
+from hashlib import blake2b
+from itertools import islice
+import json
+from multiprocessing import Pool
+import os
 
 from nltk.parse import DependencyGraph
 
+from .cache import load_columns, load_json, save_columns, save_json
+
+try:
+    import zstandard
+except ImportError: # Only needed for .zst files.
+    zstandard = None
+
+# Token features that are stored as interned string ids, in CoNLL column order.
+FIELDS = ("word", "lemma", "ctag", "tag", "feats")
+NONCE_KEYS = frozenset(FIELDS)
+# Names of the arrays of a sentence, in the order of Sentence.arrays().
+ARRAYS = ("heads", "rels", "words", "lemmas", "ctags", "tags", "feats")
+# Token line: address, word, lemma, ctag, tag, feats, head, rel; enhanced dependencies and misc are not kept.
+CONLL_LINE = "{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t_\t_\n"
+BUFFER_SIZE = 1 << 20 # Bytes that are buffered before writing to disk.
+STATS_CHUNK_SIZE = 256 # Number of sentences of which a worker process collects statistics at once.
+
+_stats_vocab = None # Vocabulary of a worker process that collects statistics, set by _init_stats_worker.
+_stats_sentences = None # Cached sentences of a worker process that collects statistics, set by _init_stats_worker.
+
+def open_conll(path, mode="r"):
+    """Opens a conll file for reading or writing text, compressed if it ends with .gz or .zst.
+
+    Args:
+        path (str): Path of the file.
+        mode (str, optional): "r" or "w". Defaults to "r".
+
+    Returns:
+        TextIO: Open file.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("Install the package zstandard to read and write .zst files.")
+        return zstandard.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8", buffering=BUFFER_SIZE)
+
+def read_conllu(lines):
+    """Splits lines in the 10 column conll-u format into sentences in one pass.
+
+    Args:
+        lines (Iterable[str]): Lines of a conll file, e.g. an open file.
+
+    Yields:
+        Tuple[List[str], List[List[str]], List[str]]: For each sentence its comment lines, the fields
+            of every token line and the lines of multiword tokens and empty nodes, without line breaks.
+    """
+    comments, rows, extras = [], [], []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if not line or line.isspace(): # Empty line means a new sentence will start.
+            if rows:
+                yield comments, rows, extras
+            comments, rows, extras = [], [], []
+        elif line[0] == "#":
+            comments.append(line)
+        else:
+            fields = line.split("\t")
+            if len(fields) != 10: # Columns are separated by spaces.
+                fields = line.split()
+            if "-" in fields[0] or "." in fields[0]: # Multiword token or empty node.
+                extras.append("\t".join(fields))
+            else:
+                rows.append(fields)
+    if rows: # Last sentence is not followed by an empty line.
+        yield comments, rows, extras
+
+def comment_value(comments, key):
+    """Gets the value of a comment like '# sent_id = 1', None if there is no such comment."""
+    prefix = "# {} =".format(key)
+    for comment in comments:
+        if comment.startswith(prefix):
+            return comment[len(prefix):].strip()
+    return None
+
+class Vocab:
+
+    __slots__ = ("ids", "strings")
+
+    def __init__(self):
+        """Creates a vocabulary that maps strings to integer ids and back.
+
+        Id 0 is reserved for None, e.g. the features of the TOP node.
+        """
+        self.ids = {None: 0}
+        self.strings = [None]
+
+    @classmethod
+    def from_strings(cls, strings):
+        """Creates a vocabulary from a list of strings, where the first one must be None."""
+        vocab = cls()
+        vocab.strings = list(strings)
+        vocab.ids = {string: idx for idx, string in enumerate(vocab.strings)}
+        return vocab
+
+    def intern(self, string):
+        """Gets id of a string, adds it to the vocabulary if it is new."""
+        try:
+            return self.ids[string]
+        except KeyError:
+            idx = len(self.strings)
+            self.ids[string] = idx
+            self.strings.append(string)
+            return idx
+
+    def __getitem__(self, idx):
+        return self.strings[idx]
+
+    def __len__(self):
+        return len(self.strings)
+
+
 class Chunk:
 
-    def __init__(self, dg, address, root=False):
+    __slots__ = ("head", "indices", "min", "max", "projective")
+
+    def __init__(self, sentence, address, root=False):
         """Create a chunk object.
 
         Args:
-            dg (nltk.DependencyGraph): The Dependency Graph that contains the chunk.
+            sentence (Sentence): The Sentence that contains the chunk.
             address (int): Address of the head of the chunk.
             root (bool, optional): Whether or not this chunk is the root. Defaults to False.
         """
-        self.dg = dg
         self.head = address
         self.indices = [address]
         if root is False: # Finding chunks for root results in whole sentence.
-            self.indices = sorted(self.find_chunk(dg, address))
+            self.indices = list(sentence.subtree(address))
         self.min = self.indices[0]
         self.max = self.indices[-1]
-        self.projective = True
-        self.assert_full_range()
-
-    def assert_full_range(self):
-        if self.indices != list(range(self.min, self.max+1)):
-            self.projective = False
- 
-    def find_chunk(self, dg, address):
-        """ Finds all dependents of an address in a dependency graph.
-        Args:
-            dg (nltk.DependencyGraph): The 
-            address (int): Address of node in dependency graph.
+        self.projective = root or sentence.is_projective(address)
 
-        Returns:
-            list: List of all dependents adresses and the node address itself
-        """
-        deps = dg.nodes[address]["deps"]
-        all_deps = [address]
-        for d in deps:
-            for ad in deps[d]:
-                all_deps += self.find_chunk(dg, ad)
-        return all_deps
-    
     def __len__(self):
         return len(self.indices)
 
@@ -52,39 +151,121 @@ class Chunk:
 
 class Sentence:
 
-    def __init__(self, dg):
+    __slots__ = ("vocab", "heads", "rels", "words", "lemmas", "ctags", "tags", "feats",
+                 "children", "subtrees", "comments", "extras", "root", "direct_dependents", "chunks", "_fingerprint")
+
+    # Attribute that stores the ids of each feature in FIELDS.
+    COLUMNS = {"word": "words", "lemma": "lemmas", "ctag": "ctags", "tag": "tags", "feats": "feats"}
+
+    def __init__(self, vocab, heads, rels, words, lemmas, ctags, tags, feats, tree=None, comments=(), extras=()):
         """Creates a Sentence object.
 
+        All arguments except the vocabulary are arrays with one entry per node.
+        Index 0 is the TOP node, so addresses can be used as indices directly.
+        The arrays are never changed after creation, so they can be shared between sentences.
+
         Args:
-            dg (nltk.DependencyGraph): Dependency graph that contains sentence information.
+            vocab (Vocab): Vocabulary that maps the ids in the arrays to strings.
+            heads (array): Address of the head of each node, -1 for TOP.
+            rels (array): Relation label id of each node.
+            words (array): Word id of each node.
+            lemmas (array): Lemma id of each node.
+            ctags (array): Coarse tag id of each node.
+            tags (array): Tag id of each node.
+            feats (array): Morphological features id of each node.
+            tree (tuple, optional): Children and subtrees of each node if they are already known,
+                e.g. from the sentence this one was derived from. Defaults to None.
+            comments (tuple, optional): Comment lines, e.g. '# sent_id = 1'. Defaults to ().
+            extras (tuple, optional): Lines of multiword tokens and empty nodes. Defaults to ().
         """
-        self.dg = dg
+        self.vocab = vocab
+        self.heads = heads
+        self.rels = rels
+        self.words = words
+        self.lemmas = lemmas
+        self.ctags = ctags
+        self.tags = tags
+        self.feats = feats
+        self.comments = comments
+        self.extras = extras
+        self._fingerprint = None
+        if tree is None:
+            tree = self._build_tree()
+        self.children, self.subtrees = tree
         self.root = self._find_root()
-        # Set top dependent to root in case it's been moved:
-        self.dg.nodes[0]["deps"]= {"root": [self.root]}
-        self.dg.nodes[0]["head"] = None
-        self.direct_dependents = self._direct_dependents(self.root) 
+        self.direct_dependents = self._direct_dependents(self.root)
         self.chunks = self._identify_chunks()
-        self.ordered_nodes = sorted(self.dg.nodes.keys()) # This is the real word order of the sentence.
-    
-    def _find_root(self, name="root", dg=None):
-        """Finds address of root in Dependency Graph.
+
+    def _build_tree(self):
+        """Finds children and subtree of every node in one iterative pass.
+
+        Returns:
+            Tuple[tuple, tuple]: Sorted addresses of the children and of the subtree of each node,
+                a subtree contains the node itself and all its dependents.
+        """
+        heads = self.heads
+        children = [[] for _ in heads]
+        for address in range(1, len(heads)):
+            children[heads[address]].append(address)
+        # Heads come before their dependents in this order.
+        order = []
+        stack = [0]
+        while stack:
+            address = stack.pop()
+            order.append(address)
+            stack.extend(children[address])
+        subtrees = [()] * len(heads)
+        for address in reversed(order): # Post-order, dependents come first.
+            members = [address]
+            for child in children[address]:
+                members.extend(subtrees[child])
+            members.sort()
+            subtrees[address] = tuple(members)
+        return tuple(map(tuple, children)), tuple(subtrees)
+
+    def _remap_tree(self, order, redirects):
+        """Derives children and subtrees for a remapped sentence from the ones of this sentence.
+
+        Args:
+            order (List[int]): Old addresses in their new order, starting with TOP.
+            redirects (dict): Old addresses mapped to new addresses.
+
+        Returns:
+            Tuple[tuple, tuple]: Children and subtrees like _build_tree.
+        """
+        children = []
+        subtrees = []
+        for old in order:
+            children.append(tuple(sorted(redirects[c] for c in self.children[old] if c in redirects)))
+            # Mostly still in order, so sorting is cheap.
+            subtrees.append(tuple(sorted(redirects[i] for i in self.subtrees[old] if i in redirects)))
+        return tuple(children), tuple(subtrees)
+
+    def subtree(self, address):
+        """Gets sorted addresses of a node and all its dependents."""
+        return self.subtrees[address]
+
+    def is_projective(self, address):
+        """Whether the subtree of a node covers a full range of addresses."""
+        subtree = self.subtrees[address]
+        return subtree[-1] - subtree[0] + 1 == len(subtree)
+
+    def _find_root(self, name="root"):
+        """Finds address of root in sentence.
 
         Args:
             name (str, optional): String that signifies root. Defaults to "root".
-            dg (nltk.DependencyGraph, optional): Dependency Graph where root is stored. Defaults to None.
 
         Raises:
-            ValueError: _description_
+            ValueError: If there is no node with the root label.
 
         Returns:
             int: Address of root node.
         """
-        if dg is None:
-            dg = self.dg
+        root_id = self.vocab.ids.get(name)
         root = None
-        for node, feats in self.dg.nodes.items():
-            if feats["rel"] == name:
+        for node, rel in enumerate(self.rels):
+            if rel == root_id:
                root = node
         if root is None:
             raise ValueError("Could not find root in dependency graph!")
@@ -99,12 +280,7 @@ class Sentence:
         Returns:
             list: list of address indices
         """
-        node_deps = self.dg.nodes[address]["deps"]
-        dependents = []
-        for rel_dep in node_deps:
-            for idx in node_deps[rel_dep]:
-                dependents.append(idx)
-        return dependents
+        return list(self.children[address])
 
     def _identify_chunks(self):
         """Gets all chunks from root.
@@ -116,15 +292,52 @@ class Sentence:
         chunks = []
         for dep in root_dependents:
             if dep != self.root:
-                chunk = Chunk(self.dg, dep)
+                chunk = Chunk(self, dep)
             else:
-                chunk = Chunk(self.dg, dep, root=True)
+                chunk = Chunk(self, dep, root=True)
             chunks.append(chunk)
         return chunks
-    
+
+    @property
+    def sent_id(self):
+        """Value of the sent_id comment, None if there is none."""
+        return comment_value(self.comments, "sent_id")
+
     def word(self, address):
         """Gets word string from address indix."""
-        return self.dg.nodes[address]["word"]
+        return self.vocab[self.words[address]]
+
+    def rel(self, address):
+        """Gets relation label string from address index."""
+        return self.vocab[self.rels[address]]
+
+    def tag(self, address):
+        """Gets tag string from address index."""
+        return self.vocab[self.tags[address]]
+
+    def columns(self):
+        """Gets the feature arrays in the order of FIELDS."""
+        return (self.words, self.lemmas, self.ctags, self.tags, self.feats)
+
+    def arrays(self):
+        """Gets all arrays in the order of the constructor arguments after the vocabulary."""
+        return (self.heads, self.rels, *self.columns())
+
+    @property
+    def fingerprint(self):
+        """Hash of the structure and tokens of the sentence, computed once.
+
+        Equal sentences of the same vocabulary have the same fingerprint. Comments are not included.
+
+        Returns:
+            int: Unsigned 64 bit integer.
+        """
+        if self._fingerprint is None:
+            digest = blake2b(digest_size=8)
+            for values in self.arrays():
+                digest.update(values.tobytes())
+            self._fingerprint = int.from_bytes(digest.digest(), "little")
+        return self._fingerprint
 
     def is_nonprojective(self):
         if all(chunk.projective for chunk in self.chunks):
@@ -133,123 +346,771 @@ class Sentence:
 
     def __repr__(self):
         string = ""
-        for i in self.ordered_nodes:
+        for i in range(1, len(self.heads)):
             word = self.word(i)
             if word is not None:
                 string += word + " "
         return "Sentence({})".format(string)
-    
+
     def __len__(self):
-        return len(self.dg.nodes) - 1 # Subtract one to disregard TOP node.
+        return len(self.heads) - 1 # Subtract one to disregard TOP node.
+
+    def to_conll(self, comments=True):
+        """Gets the sentence in the 10 column conll format.
+
+        Args:
+            comments (bool, optional): Whether to include comments, multiword tokens and empty nodes. Defaults to True.
+
+        Returns:
+            str: Lines of the sentence, each one ending with a line break.
+        """
+        strings = self.vocab.strings
+        lookup = strings.__getitem__
+        n = len(self.heads)
+        columns = [map(lookup, column[1:]) for column in self.columns()]
+        lines = list(map(CONLL_LINE.format, range(1, n), *columns, self.heads[1:], map(lookup, self.rels[1:])))
+        if comments is False:
+            return "".join(lines)
+        if self.extras:
+            lines = self._insert_extras(lines)
+        if self.comments:
+            lines = [comment + "\n" for comment in self.comments] + lines
+        return "".join(lines)
+
+    def _insert_extras(self, lines):
+        """Inserts multiword tokens before their first word and empty nodes after the word they follow."""
+        before = dict()
+        after = dict()
+        for line in self.extras:
+            ident = line.split("\t", 1)[0]
+            if "-" in ident:
+                before.setdefault(int(ident.split("-")[0]), []).append(line + "\n")
+            else:
+                after.setdefault(int(ident.split(".")[0]), []).append(line + "\n")
+        merged = after.get(0, [])
+        for address, line in enumerate(lines, start=1):
+            merged.extend(before.get(address, ()))
+            merged.append(line)
+            merged.extend(after.get(address, ()))
+        return merged
+
+    @property
+    def dg(self):
+        """Dependency graph of this sentence, built on demand."""
+        return self.to_dependency_graph()
+
+    def to_dependency_graph(self):
+        """Builds an nltk.DependencyGraph from the sentence.
+
+        Returns:
+            nltk.DependencyGraph: Dependency graph with the same nodes as this sentence.
+        """
+        dg = DependencyGraph()
+        vocab = self.vocab
+        for address in range(1, len(self.heads)):
+            head = self.heads[address]
+            rel = vocab[self.rels[address]]
+            dg.nodes[address].update({
+                "address": address,
+                "word": vocab[self.words[address]],
+                "lemma": vocab[self.lemmas[address]],
+                "ctag": vocab[self.ctags[address]],
+                "tag": vocab[self.tags[address]],
+                "feats": vocab[self.feats[address]],
+                "head": head,
+                "rel": rel,
+            })
+            dg.nodes[head]["deps"][rel].append(address)
+        dg.root = dg.nodes[self.root]
+        return dg
 
     @classmethod
-    def from_new_order(cls, dg, new_order):
-        """Instantiates a new Sentence object from a new word order.
+    def from_conllu(cls, vocab, rows, comments=(), extras=()):
+        """Instantiates a Sentence object from the fields of conll-u lines, see read_conllu.
 
         Args:
-            dg (nltk.DependencyGraph): Dependency Graph with old chunk order.
+            vocab (Vocab): Vocabulary in which the strings are interned.
+            rows (List[List[str]]): The 10 fields of every token line.
+            comments (Iterable[str], optional): Comment lines. Defaults to ().
+            extras (Iterable[str], optional): Lines of multiword tokens and empty nodes. Defaults to ().
+
+        Returns:
+            Sentence: New Sentence object.
+        """
+        intern = vocab.intern
+        fields = list(zip(*rows)) # Columns of the conll lines.
+        heads = array("i", [-1])
+        heads.extend(map(int, fields[6]))
+        arrays = [heads]
+        for column in (7, 1, 2, 3, 4, 5): # Order of ARRAYS.
+            ids = array("i", [0])
+            ids.extend(map(intern, fields[column]))
+            arrays.append(ids)
+        return cls(vocab, *arrays, comments=tuple(comments), extras=tuple(extras))
+
+    @classmethod
+    def from_dependency_graph(cls, dg, vocab):
+        """Instantiates a Sentence object from an nltk.DependencyGraph.
+
+        Args:
+            dg (nltk.DependencyGraph): Dependency graph that contains sentence information.
+            vocab (Vocab): Vocabulary in which the strings are interned.
+
+        Returns:
+            Sentence: New Sentence object.
+        """
+        addresses = sorted(dg.nodes.keys())
+        nodes = [dg.nodes[a] for a in addresses[1:]] # First one is TOP.
+        heads = array("i", [-1])
+        heads.extend(node["head"] for node in nodes)
+        rels = array("i", [0])
+        rels.extend(vocab.intern(node["rel"]) for node in nodes)
+        columns = []
+        for field in FIELDS:
+            column = array("i", [0])
+            column.extend(vocab.intern(node[field]) for node in nodes)
+            columns.append(column)
+        return cls(vocab, heads, rels, *columns)
+
+    def _remap_extras(self, redirects):
+        """Keeps multiword tokens whose words are still next to each other in the same order.
+
+        Empty nodes are dropped, since the nodes they refer to may have moved.
+
+        Args:
+            redirects (dict): Old addresses mapped to new addresses.
+
+        Returns:
+            tuple: Lines of the multiword tokens with new ids.
+        """
+        extras = []
+        for line in self.extras:
+            ident, rest = line.split("\t", 1)
+            if "-" not in ident:
+                continue
+            start, end = map(int, ident.split("-"))
+            new = [redirects.get(a) for a in range(start, end+1)]
+            if None in new or new != list(range(new[0], new[0] + len(new))):
+                continue
+            extras.append("{}-{}\t{}".format(new[0], new[-1], rest))
+        return tuple(extras)
+
+    @classmethod
+    def from_new_order(cls, sentence, new_order):
+        """Instantiates a new Sentence object from a new word order, see Augmentation.from_new_order.
+
+        Args:
+            sentence (Sentence): Sentence with old chunk order.
             new_order (List[Chunk]): List of reorderd chunks
 
         Returns:
             Sentence: New Sentence object with reorderd nodes.
         """
-        new_dg = DependencyGraph()
-        new_address_dict = {}
-        redirects = {}
-        # Add TOP:
-        new_address_dict[0] = dg.nodes[0]
-        redirects[0] = 0
-        idx = 1 # Top is always 0, stays at same position.
-        # Store where addresses have been moved to.
-        for chunk in new_order:
-            for i in chunk.indices:
-                redirects[i] = idx
-                new_address_dict[idx] = deepcopy(dg.nodes[i]) # Keep original dg unchanged later on.
-                idx += 1
-        new_dg.nodes = new_address_dict
-        # Change all values for address, head and dependents to new addresses.
-        for address in new_dg.nodes:
-            features = new_dg.nodes[address]
-            features["address"] = redirects[features["address"] ]
-            features["head"] = redirects.get(features["head"], 0)
-            for dep, index_list in features["deps"].items():
-                new_deps_idx = [redirects[i] for i in index_list]
-                features["deps"][dep] = new_deps_idx
-        return cls(new_dg)
+        return Augmentation.from_new_order(sentence, new_order).materialize()
 
     @classmethod
-    def from_removal(cls, dg, address):
-        """Removes node and all its children from dependency graph.
+    def from_removal(cls, sentence, address):
+        """Removes node and all its children from a sentence, see Augmentation.from_removal.
 
         Args:
-            dg (nltk.DependencyGraph: old Dependency Graph
+            sentence (Sentence): old Sentence
             address (int): Address that should be removed.
 
         Returns:
             Sentence: New Sentence with removed node.
         """
-        new_dg = DependencyGraph()
-        address_chunk = Chunk(dg, address) # Identify all children.
-        new_address_dict = dict()
-        # Remove dependency of chunk head from root.
-        for a in dg.nodes:
-            if a not in address_chunk.indices: # Only add to new dg if its not in removed chunk.
-                feats = deepcopy(dg.nodes[a])
-                for dep, indices in feats["deps"].items():
-                    # Remove addresses of removed chunk.
-                    new_idx = [i for i in indices if i not in address_chunk.indices]
-                    feats["deps"][dep] = new_idx
-                new_address_dict[a] = feats
-        redirects = dict()
-        # Address need to be a full sequence, we need to change the address accordingly.
-        # Ex: Original 1 2 3 --> Remove 2 --> 1 3 Full range --> 1 2
-        for idx, key in enumerate(sorted(new_address_dict.keys())):
-            redirects[key] = idx
-        final_address = dict()
-        # Change all values for address, head and dependents to new addresses.
-        for address, features in new_address_dict.items():
-            new_a = redirects[address]
-            features["address"] = redirects[features["address"] ]
-            features["head"] = redirects.get(features["head"], 0)
-            for dep, index_list in features["deps"].items():
-                new_deps_idx = [redirects[i] for i in index_list]
-                features["deps"][dep] = new_deps_idx
-            final_address[new_a] = features
-        new_dg.nodes = final_address
-        return cls(new_dg)
+        return Augmentation.from_removal(sentence, address).materialize()
 
     @classmethod
-    def from_replacement(cls, dg, address, updates):
-        """Replace a word in a tree by a different one.
+    def from_replacement(cls, sentence, address, updates):
+        """Replace a word in a tree by a different one, see Augmentation.from_replacement.
 
         Args:
-            dg (nltk.DependencyGraph): _Old dependency graph
+            sentence (Sentence): Old sentence
             address (int): Address that should be replaced.
-            updates (dict): Values that should be updated, e.g. word, lemma etc.
+            updates (Iterable[Tuple[str, int]]): Feature ids that should be updated, e.g. word, lemma etc.
 
         Returns:
             Sentence: new Sentence object with replaced word at given address.
         """
-        new_dg = deepcopy(dg) # Do not change original dg.
-        address_feats = new_dg.nodes[address]
-        address_feats.update(updates) # This does not change dependents or head etc.
-        return cls(new_dg)
+        return Augmentation.from_replacement(sentence, address, updates).materialize()
 
     def __eq__(self, __o: object) -> bool:
-        return __o == self.dg.nodes
+        if not isinstance(__o, Sentence):
+            return NotImplemented
+        if self.fingerprint != __o.fingerprint:
+            return False
+        return (self.heads == __o.heads and self.rels == __o.rels
+                and self.columns() == __o.columns())
 
     def __hash__(self) -> int:
-        return hash(str(self))
+        return self.fingerprint
+
+class Augmentation(Sentence):
+
+    __slots__ = ("source", "order", "address", "updates", "_arrays", "_extras", "_sentence")
+
+    def __init__(self, source, order=None, address=None, updates=None):
+        """Creates a lazy view of a sentence that is derived from another one.
+
+        Only the source and the change are stored. The arrays are computed when the view is hashed,
+        compared or formatted, and a full Sentence with tree and chunks is only built when an attribute
+        that needs it is accessed, see materialize.
+
+        Args:
+            source (Sentence): Sentence the view is derived from.
+            order (List[int], optional): Old addresses in their new order, starting with TOP,
+                for rotations and removals. Defaults to None.
+            address (int, optional): Address of the word that is replaced. Defaults to None.
+            updates (Iterable[Tuple[str, int]], optional): Feature ids of the replacement. Defaults to None.
+        """
+        self.source = source
+        self.order = order
+        self.address = address
+        self.updates = updates
+        self.vocab = source.vocab
+        self.comments = ()
+        self._fingerprint = None
+        self._arrays = None
+        self._extras = None
+        self._sentence = None
+
+    @classmethod
+    def from_new_order(cls, sentence, new_order):
+        """Creates a view of a sentence with reordered chunks.
+
+        Args:
+            sentence (Sentence): Sentence with old chunk order.
+            new_order (List[Chunk]): List of reorderd chunks.
+
+        Returns:
+            Augmentation: View with reordered nodes.
+        """
+        order = [0] # Top is always 0, stays at same position.
+        for chunk in new_order:
+            order.extend(chunk.indices)
+        return cls(sentence, order=order)
+
+    @classmethod
+    def from_removal(cls, sentence, address):
+        """Creates a view of a sentence without a node and its subtree.
+
+        Args:
+            sentence (Sentence): Old sentence.
+            address (int): Address that should be removed.
+
+        Returns:
+            Augmentation: View without the node and its children.
+        """
+        removed = set(sentence.subtree(address)) # Identify all children.
+        # Address need to be a full sequence, remaining nodes are moved up.
+        # Ex: Original 1 2 3 --> Remove 2 --> 1 3 Full range --> 1 2
+        return cls(sentence, order=[a for a in range(len(sentence.heads)) if a not in removed])
+
+    @classmethod
+    def from_replacement(cls, sentence, address, updates):
+        """Creates a view of a sentence with a replaced word.
+
+        Args:
+            sentence (Sentence): Old sentence.
+            address (int): Address that should be replaced.
+            updates (Iterable[Tuple[str, int]]): Feature ids that should be updated, e.g. word, lemma etc.
+
+        Returns:
+            Augmentation: View with the replaced word, the tree does not change.
+        """
+        return cls(sentence, address=address, updates=updates)
+
+    def _build(self):
+        """Computes the arrays and extra lines of the view, without tree and chunks."""
+        source = self.source
+        if self.order is not None:
+            order = self.order
+            redirects = {old: new for new, old in enumerate(order)}
+            heads = array("i", [-1])
+            heads.extend(redirects[source.heads[i]] for i in order[1:])
+            rest = [array("i", (values[i] for i in order)) for values in source.arrays()[1:]]
+            self._arrays = (heads, *rest)
+            self._extras = source._remap_extras(redirects)
+        else:
+            columns = dict(zip(FIELDS, source.columns()))
+            for field, value in self.updates: # Only copy changed arrays, others are shared.
+                column = array("i", columns[field])
+                column[self.address] = value
+                columns[field] = column
+            self._arrays = (source.heads, source.rels, *(columns[field] for field in FIELDS))
+            # Multiword tokens that contain the replaced word do not match anymore.
+            self._extras = tuple(line for line in source.extras if not _covers(line, self.address))
+
+    def arrays(self):
+        if self._arrays is None:
+            self._build()
+        return self._arrays
+
+    def columns(self):
+        return self.arrays()[2:]
+
+    heads = property(lambda self: self.arrays()[0])
+    rels = property(lambda self: self.arrays()[1])
+    words = property(lambda self: self.arrays()[2])
+    lemmas = property(lambda self: self.arrays()[3])
+    ctags = property(lambda self: self.arrays()[4])
+    tags = property(lambda self: self.arrays()[5])
+    feats = property(lambda self: self.arrays()[6])
+
+    @property
+    def extras(self):
+        if self._extras is None:
+            self._build()
+        return self._extras
+
+    def materialize(self):
+        """Gets the full Sentence of this view, builds it on first use.
+
+        Returns:
+            Sentence: Sentence with the same arrays, comments and extra lines as the view.
+        """
+        if self._sentence is None:
+            source = self.source
+            if self.order is not None:
+                tree = source._remap_tree(self.order, {old: new for new, old in enumerate(self.order)})
+            else:
+                tree = (source.children, source.subtrees) # Replacing a word does not change the tree.
+            self._sentence = Sentence(self.vocab, *self.arrays(), tree=tree, comments=self.comments, extras=self.extras)
+        self._sentence.comments = self.comments
+        return self._sentence
+
+    def __getattr__(self, name):
+        # Only called for attributes that a view does not have, e.g. chunks or children.
+        if name in Augmentation.__slots__:
+            raise AttributeError(name)
+        return getattr(self.materialize(), name)
+
+def _covers(line, address):
+    """Whether the line of a multiword token contains the word at an address."""
+    ident = line.split("\t", 1)[0]
+    if "-" not in ident:
+        return False
+    start, end = map(int, ident.split("-"))
+    return start <= address <= end
+
+class NonceIndex:
+
+    def __init__(self, by_rel, by_rel_tag, keys=NONCE_KEYS):
+        """Creates an index of possible replacements for every relation label, see from_stats.
+
+        Candidates are stored as tuples so that they can be sampled directly.
+
+        Args:
+            by_rel (dict): Relation id -> tuple of candidates, each one a tuple of (key, id) pairs.
+            by_rel_tag (dict): (Relation id, tag id) -> tuple of candidates.
+            keys (set, optional): Features that are replaced. Defaults to NONCE_KEYS.
+        """
+        self.keys = frozenset(keys)
+        self.by_rel = by_rel
+        self.by_rel_tag = by_rel_tag
+
+    @classmethod
+    def from_stats(cls, stats, vocab, keys=NONCE_KEYS):
+        """Creates the index from the candidates collected in corpus statistics.
+
+        The candidates are in the order of their first occurence in the corpus.
+        Identical feature tuples are only stored once.
+
+        Args:
+            stats (CorpusStats): Statistics of the corpus.
+            vocab (Vocab): Vocabulary in which the strings of the candidates are interned.
+            keys (set, optional): Features that are replaced. Defaults to NONCE_KEYS.
+
+        Returns:
+            NonceIndex: Index of possible replacements.
+        """
+        positions = [i for i, field in enumerate(FIELDS) if field in keys]
+        fields = [FIELDS[i] for i in positions]
+        tag_position = FIELDS.index("tag")
+        intern = vocab.intern
+        by_rel = dict()
+        by_rel_tag = dict()
+        interned = dict()
+        for rel, candidates in stats.candidates.items():
+            rel = intern(rel)
+            for cand in candidates:
+                updates = tuple((field, intern(cand[i])) for field, i in zip(fields, positions))
+                updates = interned.setdefault(updates, updates) # Share identical tuples between labels.
+                # Dicts keep the order of first occurence and drop duplicates.
+                by_rel.setdefault(rel, dict())[updates] = None
+                by_rel_tag.setdefault((rel, intern(cand[tag_position])), dict())[updates] = None
+        return cls({rel: tuple(cands) for rel, cands in by_rel.items()},
+                   {key: tuple(cands) for key, cands in by_rel_tag.items()}, keys)
+
+    def candidates(self, rel, tag=None):
+        """Gets possible replacements for a relation label.
+
+        Args:
+            rel (int): Relation label id of the word that should be replaced.
+            tag (int, optional): If given, only replacements with this tag id are returned. Defaults to None.
+
+        Returns:
+            tuple: Tuple of candidates, each one a tuple of (key, id) pairs. Empty if there are none.
+        """
+        if tag is None:
+            return self.by_rel.get(rel, ())
+        return self.by_rel_tag.get((rel, tag), ())
+
+class CorpusStats:
+
+    def __init__(self):
+        """Statistics of a corpus that are collected in a single pass over its sentences.
+
+        All statistics are counts keyed by strings, so statistics of different parts of a corpus
+        can be merged, even if they were collected with different vocabularies, and stored as JSON.
+        """
+        self.n_sentences = 0
+        self.n_tokens = 0
+        self.positions = dict() # Head relation -> dependent relation -> [left, right] counts.
+        self.candidates = dict() # Relation -> distinct (word, lemma, ctag, tag, feats) in order of first occurence.
+        self.relations = dict() # Relation -> frequency.
+        self.tags = dict() # Tag -> frequency.
+        self.chunk_counts = dict() # Number of chunks -> number of sentences.
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        stats = cls()
+        for sentence in sentences:
+            stats.add(sentence)
+        return stats
+
+    def add(self, sentence):
+        """Counts the tokens of a sentence."""
+        strings = sentence.vocab.strings
+        heads = sentence.heads
+        rels = [strings[rel] for rel in sentence.rels]
+        columns = [[strings[value] for value in getattr(sentence, Sentence.COLUMNS[field])] for field in FIELDS]
+        positions, candidates, relations, tags = self.positions, self.candidates, self.relations, self.tags
+        for rel in rels:
+            positions.setdefault(rel, dict())
+        for address, cand in enumerate(zip(*columns)):
+            if address == 0: # TOP node.
+                continue
+            rel = rels[address]
+            head = heads[address]
+            positions[rels[head]].setdefault(rel, [0, 0])[address > head] += 1
+            candidates.setdefault(rel, dict())[cand] = None # Dicts keep the order and drop duplicates.
+            relations[rel] = relations.get(rel, 0) + 1
+            tags[cand[3]] = tags.get(cand[3], 0) + 1
+        n_chunks = len(sentence.chunks)
+        self.chunk_counts[n_chunks] = self.chunk_counts.get(n_chunks, 0) + 1
+        self.n_sentences += 1
+        self.n_tokens += len(heads) - 1
+
+    def merge(self, other):
+        """Adds the statistics of another part of the corpus, which comes after this one.
+
+        Args:
+            other (CorpusStats): Statistics of the other part.
+
+        Returns:
+            CorpusStats: This object.
+        """
+        self.n_sentences += other.n_sentences
+        self.n_tokens += other.n_tokens
+        for head_rel, dependents in other.positions.items():
+            counts = self.positions.setdefault(head_rel, dict())
+            for rel, (left, right) in dependents.items():
+                total = counts.setdefault(rel, [0, 0])
+                total[0] += left
+                total[1] += right
+        for rel, candidates in other.candidates.items():
+            self.candidates.setdefault(rel, dict()).update(candidates)
+        for own, others in ((self.relations, other.relations), (self.tags, other.tags),
+                            (self.chunk_counts, other.chunk_counts)):
+            for key, count in others.items():
+                own[key] = own.get(key, 0) + count
+        return self
+
+    def position_probabilities(self):
+        """Calculates how likely labels are to be to left or right of their head.
+
+        Returns:
+            dict: Head relation -> dependent relation -> {"left": probability, "right": probability}.
+        """
+        probs = dict()
+        for head_rel, dependents in self.positions.items():
+            probs[head_rel] = {rel: {"left": left / (left + right), "right": right / (left + right)}
+                               for rel, (left, right) in dependents.items()}
+        return probs
+
+    def to_dict(self):
+        """Gets the statistics as a dictionary that can be stored as JSON. Keys may be None, so pairs are used."""
+        return {"n_sentences": self.n_sentences, "n_tokens": self.n_tokens,
+                "positions": [[head_rel, list(dependents.items())] for head_rel, dependents in self.positions.items()],
+                "candidates": [[rel, list(candidates)] for rel, candidates in self.candidates.items()],
+                "relations": list(self.relations.items()), "tags": list(self.tags.items()),
+                "chunk_counts": list(self.chunk_counts.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.n_sentences = data["n_sentences"]
+        stats.n_tokens = data["n_tokens"]
+        stats.positions = {head_rel: dict(dependents) for head_rel, dependents in data["positions"]}
+        stats.candidates = {rel: dict.fromkeys(map(tuple, candidates)) for rel, candidates in data["candidates"]}
+        stats.relations = dict(data["relations"])
+        stats.tags = dict(data["tags"])
+        stats.chunk_counts = dict(data["chunk_counts"])
+        return stats
+
+def _init_stats_worker(strings, sentences=None):
+    global _stats_vocab, _stats_sentences
+    _stats_vocab = Vocab.from_strings(strings)
+    _stats_sentences = sentences
+
+def _stats_chunk(chunk):
+    """Collects the statistics of sentences that are sent as arrays to a worker process."""
+    return CorpusStats.from_sentences(Sentence(_stats_vocab, *arrays) for arrays in chunk)
+
+def _stats_range(chunk):
+    """Collects the statistics of a range of cached sentences, which the worker process reads from its own map."""
+    return CorpusStats.from_sentences(_stats_sentences[slice(*chunk)])
+
+class ConllWriter:
+
+    def __init__(self, path, comments=True):
+        """Creates a writer that appends sentences to a conll file as soon as they are produced.
+
+        Output is buffered and written in large blocks. Paths ending with .gz or .zst are compressed.
+
+        Args:
+            path (str): Path of output file, is overwritten.
+            comments (bool, optional): Whether to write comments, multiword tokens and empty nodes. Defaults to True.
+        """
+        self.path = path
+        self.comments = comments
+        self.file = None
+
+    def open(self):
+        self.file = open_conll(self.path, "w")
+        return self
+
+    def write(self, sentence, augmentations=()):
+        """Writes a sentence followed by its augmentations.
+
+        Args:
+            sentence (Sentence): Original sentence.
+            augmentations (Iterable[Sentence], optional): Augmented sentences. Defaults to ().
+        """
+        self.file.write(self.format(sentence, augmentations, self.comments))
+
+    def write_text(self, text):
+        """Writes text that was already formatted, e.g. by a worker process."""
+        self.file.write(text)
+
+    def write_sentences(self, sentences):
+        """Writes sentences that were already formatted, like ShardedWriter.write_sentences.
+
+        Args:
+            sentences (List[Tuple[str, str]]): Augmentation technique and formatted text of every sentence.
+        """
+        self.file.write("".join(text for _, text in sentences))
+
+    @staticmethod
+    def format(sentence, augmentations=(), comments=True):
+        """Formats a sentence followed by its augmentations, each one followed by an empty line.
+
+        Args:
+            sentence (Sentence): Original sentence.
+            augmentations (Iterable[Sentence], optional): Augmented sentences. Defaults to ().
+            comments (bool, optional): Whether to include comments, multiword tokens and empty nodes. Defaults to True.
+
+        Returns:
+            str: Sentences in the 10 column conll format.
+        """
+        return "".join(sent.to_conll(comments) + "\n" for sent in (sentence, *augmentations))
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ShardedWriter:
+
+    def __init__(self, directory, n_shards, suffix="", comments=True):
+        """Creates a writer that splits the output into shards with about the same number of tokens.
+
+        A sentence and its augmentations always go to the shard with the fewest tokens so far, so the
+        shards are balanced while the sentences are produced. When the writer is closed, the manifest
+        shards.json is written, see the manifest method.
+
+        Args:
+            directory (str): Directory of the shards and the manifest.
+            n_shards (int): Number of shards.
+            suffix (str, optional): ".gz" or ".zst" to compress the shards. Defaults to "".
+            comments (bool, optional): Whether to write comments, multiword tokens and empty nodes. Defaults to True.
+        """
+        self.directory = directory
+        self.names = ["augmented-{:05d}-of-{:05d}.conll{}".format(k + 1, n_shards, suffix) for k in range(n_shards)]
+        self.writers = [ConllWriter(os.path.join(directory, name), comments) for name in self.names]
+        self.tokens = [0] * n_shards
+        self.offsets = [array("q") for _ in range(n_shards)] # Byte offset of every sentence in the uncompressed shard.
+        self.bytes = [0] * n_shards
+        self.augmentations = [dict() for _ in range(n_shards)] # Technique -> number of sentences
+
+    def open(self):
+        for writer in self.writers:
+            writer.open()
+        return self
+
+    @staticmethod
+    def n_tokens(text):
+        """Counts the token lines of a formatted sentence, without multiword tokens and empty nodes."""
+        return sum(1 for line in text.split("\n") if line.split("\t", 1)[0].isdigit())
+
+    def write_sentences(self, sentences):
+        """Writes a sentence followed by its augmentations to the shard with the fewest tokens.
+
+        Args:
+            sentences (List[Tuple[str, str]]): Augmentation technique and formatted text of every sentence,
+                the technique of the input sentence is None.
+        """
+        shard = min(range(len(self.writers)), key=self.tokens.__getitem__)
+        counts = self.augmentations[shard]
+        for technique, text in sentences:
+            self.offsets[shard].append(self.bytes[shard])
+            self.bytes[shard] += len(text.encode("utf-8"))
+            self.tokens[shard] += self.n_tokens(text)
+            technique = technique or "original"
+            counts[technique] = counts.get(technique, 0) + 1
+        self.writers[shard].write_sentences(sentences)
+
+    def manifest(self):
+        """Describes the shards.
+
+        Returns:
+            dict: Total numbers of sentences, tokens and sentences per technique ("original" for input sentences),
+                and for each shard its path relative to the directory, its number of sentences, tokens and bytes,
+                the byte offset of every sentence and its number of sentences per technique. Offsets and bytes
+                refer to the uncompressed text.
+        """
+        shards = [{"path": name, "sentences": len(offsets), "tokens": tokens, "bytes": n_bytes,
+                   "augmentations": counts, "offsets": offsets.tolist()}
+                  for name, tokens, n_bytes, counts, offsets in
+                  zip(self.names, self.tokens, self.bytes, self.augmentations, self.offsets)]
+        augmentations = dict()
+        for counts in self.augmentations:
+            for technique, count in counts.items():
+                augmentations[technique] = augmentations.get(technique, 0) + count
+        return {"sentences": sum(shard["sentences"] for shard in shards), "tokens": sum(self.tokens),
+                "augmentations": augmentations, "shards": shards}
+
+    def close(self):
+        if all(writer.file is None for writer in self.writers):
+            return
+        for writer in self.writers:
+            writer.close()
+        path = os.path.join(self.directory, "shards.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.manifest(), file)
+        os.replace(path + ".tmp", path)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CachedSentences:
+
+    def __init__(self, vocab, columns, offsets, annotations=None, path=None):
+        """Sentences that are stored in columns, e.g. memory-mapped from a cache.
+
+        Sentence objects are only created when a sentence is accessed.
+
+        Args:
+            vocab (Vocab): Vocabulary that maps the ids in the columns to strings.
+            columns (Dict[str, np.ndarray]): Arrays of all sentences for each name in ARRAYS, one after another.
+            offsets (np.ndarray): Start of every sentence in the columns, followed by their length.
+            annotations (list, optional): Comments and extra lines of every sentence. Defaults to None.
+            path (str, optional): Path of the conll file if the columns are memory-mapped from its cache.
+                Defaults to None.
+        """
+        self.vocab = vocab
+        self.columns = [columns[name] for name in ARRAYS]
+        self.offsets = offsets
+        self.annotations = annotations
+        self.path = path
+
+    def __getstate__(self):
+        """Only keeps the path when pickled if the columns are memory-mapped from a cache, e.g. when sent
+        to worker processes. They map the same files again, so all processes share their pages."""
+        if self.path is None:
+            return self.__dict__
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        if "columns" in state:
+            self.__dict__.update(state)
+            return
+        strings, columns, offsets, annotations = load_columns(state["path"], "columns")
+        self.__init__(Vocab.from_strings(strings), columns, offsets, annotations, state["path"])
+
+    def n_tokens(self):
+        """Number of tokens, without the TOP node of every sentence."""
+        return int(self.offsets[-1]) - len(self)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        start, end = self.offsets[i], self.offsets[i+1]
+        comments, extras = self.annotations[i] if self.annotations is not None else ((), ())
+        return Sentence(self.vocab, *(array("i", column[start:end].tobytes()) for column in self.columns),
+                        comments=tuple(comments), extras=tuple(extras))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __len__(self):
+        return len(self.offsets) - 1
 
 class Corpus:
 
-    def __init__(self, data_file):
+    def __init__(self, data_file, stream=False, cache=False):
         """Create a corpus object.
 
         Args:
             data_file (str): Path to conll file.
+            stream (bool, optional): If True, sentences are not kept in memory but read from
+                the file again every time the corpus is iterated. Defaults to False.
+            cache (bool, optional): If True, sentences are loaded lazily from a memory-mapped binary cache
+                next to the file, which is created first if it is missing or outdated. Defaults to False.
         """
-        self.sentences = self.read_conll(data_file)
+        self.vocab = Vocab()
+        self.data_file = data_file
+        self.stream = stream and not cache
+        self.cache = cache
+        self._counts = None # Number of sentences and tokens of a streamed corpus.
+        if cache:
+            self.sentences = self.load_cache(data_file)
+        else:
+            self.sentences = None if stream else self.read_conll(data_file)
+
+    @property
+    def sentences(self):
+        return self._sentences
+
+    @sentences.setter
+    def sentences(self, sentences):
+        self._sentences = sentences
+        self._stats = None # Corpus changed, statistics and index have to be computed again.
+        self._nonce_index = None
 
     def read_conll(self, path):
         """Reads in file in conll format.
@@ -260,78 +1121,178 @@ class Corpus:
         Returns:
             List[Sentence]: List of Sentence objects
         """
-        sents = []
-        with open(path, encoding="utf-8") as file:
-            sent = ""
-            for line in file:
-                if line.strip():
-                    if not line.startswith("#"):
-                        sent += line
-                else: # Empty line means a new sentence will start.
-                    sents.append(sent)
-                    sent = ""
-        return [Sentence(DependencyGraph(s, top_relation_label="root")) for s in sents]
-    
+        return list(self.iter_conll(path))
+
+    def iter_conll(self, path):
+        """Lazily reads sentences from a file in conll format.
+
+        Args:
+            path (str): Path to the conll file.
+
+        Yields:
+            Sentence: One Sentence object at a time, in file order.
+        """
+        with open_conll(path) as file:
+            for comments, rows, extras in read_conllu(file):
+                yield Sentence.from_conllu(self.vocab, rows, comments, extras)
+
+    def load_cache(self, path):
+        """Loads sentences from the binary cache of a conll file, creates the cache if it is not valid.
+
+        Args:
+            path (str): Path to the conll file.
+
+        Returns:
+            CachedSentences: Sentences that are created when they are accessed.
+        """
+        cached = load_columns(path, "columns")
+        if cached is None:
+            self.write_cache(path)
+            cached = load_columns(path, "columns")
+        strings, columns, offsets, annotations = cached
+        self.vocab = Vocab.from_strings(strings)
+        return CachedSentences(self.vocab, columns, offsets, annotations, path)
+
+    def write_cache(self, path):
+        """Parses a conll file and writes its sentences as columns to a binary cache next to it.
+
+        Args:
+            path (str): Path to the conll file.
+        """
+        columns = {name: array("i") for name in ARRAYS}
+        offsets = [0]
+        annotations = []
+        for sentence in self.iter_conll(path):
+            annotations.append((sentence.comments, sentence.extras))
+            for name, values in zip(ARRAYS, sentence.arrays()):
+                columns[name].extend(values)
+            offsets.append(offsets[-1] + len(sentence.heads))
+        save_columns(path, "columns", self.vocab.strings, columns, offsets, annotations)
+
+    def _count(self):
+        """Counts sentences and tokens of a streamed corpus without parsing it.
+
+        Returns:
+            Tuple[int, int]: Number of sentences and number of tokens.
+        """
+        if self._counts is None:
+            n_sents = n_tokens = 0
+            in_sentence = False
+            with open_conll(self.data_file) as file:
+                for line in file:
+                    if line.strip():
+                        if not line.startswith("#"):
+                            # Multiword tokens and empty nodes are not counted.
+                            ident = line.split(None, 1)[0]
+                            n_tokens += "-" not in ident and "." not in ident
+                            in_sentence = True
+                    elif in_sentence:
+                        n_sents += 1
+                        in_sentence = False
+            self._counts = (n_sents + in_sentence, n_tokens)
+        return self._counts
+
+    def statistics(self, workers=1):
+        """Gets the statistics of this corpus, collects them in a single pass on first use.
+
+        If the corpus was loaded from a cache, the statistics are cached next to the file as well.
+
+        Args:
+            workers (int, optional): Number of processes that collect statistics of parts of the corpus,
+                which are merged afterwards. A streamed corpus is read by a single process. Defaults to 1.
+
+        Returns:
+            CorpusStats: Statistics of the corpus.
+        """
+        if self._stats is None:
+            cached = load_json(self.data_file, "stats.json") if self.cache else None
+            if cached is not None:
+                self._stats = CorpusStats.from_dict(cached)
+            elif workers <= 1 or self.stream:
+                self._stats = CorpusStats.from_sentences(self)
+            else:
+                self._stats = self._parallel_statistics(workers)
+            if self.cache and cached is None:
+                save_json(self.data_file, "stats.json", self._stats.to_dict())
+        return self._stats
+
+    def _parallel_statistics(self, workers):
+        """Collects statistics of chunks of sentences in worker processes and merges them in corpus order.
+
+        Sentences of a memory-mapped cache are not sent to the workers, they map the cache themselves
+        and only get the ranges of sentences they should count.
+        """
+        cached = self.sentences if isinstance(self.sentences, CachedSentences) and self.sentences.path else None
+        if cached is not None:
+            work = _stats_range
+            n_sents = len(cached)
+            chunks = ((start, min(start + STATS_CHUNK_SIZE, n_sents)) for start in range(0, n_sents, STATS_CHUNK_SIZE))
+        else:
+            work = _stats_chunk
+            iterator = iter(self)
+            chunks = iter(lambda: [sent.arrays() for sent in islice(iterator, STATS_CHUNK_SIZE)], [])
+        stats = CorpusStats()
+        with Pool(workers, initializer=_init_stats_worker, initargs=(self.vocab.strings, cached)) as pool:
+            for part in pool.imap(work, chunks):
+                stats.merge(part)
+        return stats
+
     def position_statistics(self):
         """Calculates how likely labels are to be to left or right of their head.
 
         Returns:
-            dict: Nested dict 
-        """
-        stats = dict()
-        for sentence in self.sentences:
-            dg = sentence.dg
-            for address, feats in dg.nodes.items():
-                rel = feats["rel"]
-                stats.setdefault(rel, dict())
-                deps = feats["deps"]
-                for d in deps:
-                    if d not in stats[rel]:
-                        stats[rel][d] = {"left": 0, "right": 0}
-                    for d_idx in deps[d]:
-                        if d_idx < address:
-                            stats[rel][d]["left"] += 1
-                        else: 
-                            stats[rel][d]["right"] += 1
-        # Normalize:
-        for rel in stats:
-            for d in stats[rel]:
-                sum_children = sum(stats[rel][d].values())
-                if sum_children == 0:
-                    continue
-                stats[rel][d]["left"] /= sum_children
-                stats[rel][d]["right"] /= sum_children
-        return stats
+            dict: Nested dict
+        """
+        return self.statistics().position_probabilities()
 
-    def nonce_features(self, keys={"word", "lemma", "ctag", "tag", "feats"}):
+    def nonce_features(self, keys=NONCE_KEYS):
         """Generates dictionary with possible replacements for all relation labels.
 
         Args:
-            keys (dict, optional): _description_. Defaults to {"word", "lemma", "ctag", "tag", "feats"}.
+            keys (set, optional): Features that are replaced. Defaults to NONCE_KEYS.
 
         Returns:
-            dict: Dict[str, Set[Tuple[str, list]]], keys are relation labels, returns set of tuples 
+            dict: Dict[str, Set[Tuple[str, list]]], keys are relation labels, returns set of tuples
             where first item is key from key and rest is value.
         """
-        nonce_dict = dict()
-        for sent in self.sentences:
-            for node_address in sent.dg.nodes:
-                feats = sent.dg.nodes[node_address]
-                rel = feats["rel"]
-                nonce_dict.setdefault(rel, set())
-                updates = {key: value for key, value in feats.items() if key in keys}
-                nonce_dict[rel].add(tuple(updates.items()))
-        return nonce_dict
-    
+        index = self.nonce_index(keys)
+        vocab = self.vocab
+        return {vocab[rel]: {tuple((key, vocab[value]) for key, value in cand) for cand in candidates}
+                for rel, candidates in index.by_rel.items()}
+
+    def nonce_index(self, keys=NONCE_KEYS):
+        """Gets the nonce index of this corpus, builds it on first use.
+
+        Args:
+            keys (set, optional): Features that are replaced. Defaults to NONCE_KEYS.
+
+        Returns:
+            NonceIndex: Index of possible replacements.
+        """
+        keys = frozenset(keys)
+        if self._nonce_index is None or self._nonce_index.keys != keys:
+            self._nonce_index = NonceIndex.from_stats(self.statistics(), self.vocab, keys)
+        return self._nonce_index
+
     def n_tokens(self):
         """Number of tokens in corpus"""
+        if self.stream:
+            return self._count()[1]
+        if isinstance(self.sentences, CachedSentences):
+            return self.sentences.n_tokens()
         return sum(len(s) for s in self.sentences)
-    
+
     def __iter__(self):
+        if self.stream:
+            return self.iter_conll(self.data_file)
         return iter(self.sentences)
 
     def __getitem__(self, i):
+        if self.stream:
+            raise TypeError("Streamed corpus does not support indexing.")
         return self.sentences[i]
-    
+
     def __len__(self):
+        if self.stream:
+            return self._count()[0]
         return len(self.sentences)
@@ -0,0 +1,75 @@
+# This file contains a compact set of sentence fingerprints for removing duplicates across a corpus.
+import numpy as np
+
+class FingerprintSet:
+
+    MAX_LOAD = 0.5 # The table grows when more than this fraction of its slots is used.
+
+    def __init__(self, capacity=1 << 16):
+        """Creates an empty set of 64 bit fingerprints.
+
+        The fingerprints are stored in a single NumPy array with open addressing and linear probing,
+        which takes 16 bytes per fingerprint instead of about 100 for a Python set of ints.
+
+        Args:
+            capacity (int, optional): Initial number of slots, rounded up to a power of two. Defaults to 1 << 16.
+        """
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.table = np.zeros(size, dtype=np.uint64)
+        self.mask = size - 1
+        self.size = 0
+
+    @staticmethod
+    def _key(fingerprint):
+        return fingerprint or 1 # 0 marks empty slots.
+
+    def _slot(self, key):
+        """Finds the slot of a key, or the empty slot where it belongs."""
+        table, mask = self.table, self.mask
+        slot = key & mask # Fingerprints are uniformly distributed already.
+        value = int(table[slot])
+        while value != 0 and value != key:
+            slot = (slot + 1) & mask
+            value = int(table[slot])
+        return slot
+
+    def _grow(self):
+        keys = self.table[self.table != 0]
+        self.table = np.zeros(2 * len(self.table), dtype=np.uint64)
+        self.mask = len(self.table) - 1
+        for key in keys.tolist():
+            self.table[self._slot(key)] = key
+
+    def add(self, fingerprint):
+        """Adds a fingerprint.
+
+        Args:
+            fingerprint (int): Unsigned 64 bit integer, e.g. Sentence.fingerprint.
+
+        Returns:
+            bool: Whether the fingerprint was new.
+        """
+        key = self._key(fingerprint)
+        slot = self._slot(key)
+        if self.table[slot] != 0:
+            return False
+        self.table[slot] = key
+        self.size += 1
+        if self.size > self.MAX_LOAD * len(self.table):
+            self._grow()
+        return True
+
+    def copy(self):
+        other = FingerprintSet.__new__(FingerprintSet)
+        other.table = self.table.copy()
+        other.mask = self.mask
+        other.size = self.size
+        return other
+
+    def __contains__(self, fingerprint):
+        return self.table[self._slot(self._key(fingerprint))] != 0
+
+    def __len__(self):
+        return self.size
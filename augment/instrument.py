@@ -0,0 +1,136 @@
+# This file contains a profiler that measures the stages of the augmentation pipeline.
+from contextlib import contextmanager
+from functools import wraps
+import inspect
+import sys
+import time
+
+from .augment import Augment
+from .data import Augmentation, ConllWriter, Corpus, Sentence, ShardedWriter
+
+# Functions that are measured while profiling, with the name of their stage.
+STAGES = (
+    (Sentence, "from_conllu", "parse"),
+    (Sentence, "_build_tree", "tree"),
+    (Sentence, "_identify_chunks", "chunks"),
+    (Corpus, "statistics", "statistics"),
+    (Corpus, "nonce_index", "nonce index"),
+    (Augment, "_permutations", "rotation sampling"),
+    (Augment, "_score_orders", "rotation scoring"),
+    (Augmentation, "from_new_order", "view: new order"),
+    (Augmentation, "from_removal", "view: removal"),
+    (Augmentation, "from_replacement", "view: replacement"),
+    (Augmentation, "_build", "view arrays"),
+    (Augmentation, "materialize", "materialize"),
+    (Sentence, "__hash__", "dedup hashing"),
+    (Sentence, "__eq__", "dedup comparison"),
+    (Sentence, "to_conll", "format"),
+    (ConllWriter, "write_sentences", "write"),
+    (ShardedWriter, "write_sentences", "write shards"), # Contains the write stage of each shard.
+)
+
+class Profiler:
+
+    def __init__(self, stages=STAGES):
+        """Records wall time, calls and net retained memory blocks per stage.
+
+        Functions are only replaced by measuring wrappers while the profiler is used as
+        a context manager, so there is no overhead at all when profiling is disabled.
+        Times are inclusive: a stage that calls another one also contains its time. Net retained blocks
+        are the change of sys.getallocatedblocks() over the calls, which is negative if more was freed.
+
+        Args:
+            stages (Iterable[tuple], optional): Class, attribute and stage name of each function
+                that is measured. Defaults to STAGES.
+        """
+        self.stages = stages
+        self.stats = dict() # Stage name -> [calls, seconds, net retained blocks]
+        self._patched = []
+
+    def record(self, name, seconds, blocks):
+        stats = self.stats.setdefault(name, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] += blocks
+
+    @contextmanager
+    def stage(self, name):
+        """Measures the code in a with block as a stage."""
+        blocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+
+    def _wrap(self, function, name):
+        record = self.record
+        @wraps(function)
+        def measured(*args, **kwargs):
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start, sys.getallocatedblocks() - blocks)
+        return measured
+
+    def instrument(self, owner, attribute, name):
+        """Replaces a function of a class by a wrapper that measures it as a stage."""
+        original = inspect.getattr_static(owner, attribute)
+        if isinstance(original, (classmethod, staticmethod)):
+            wrapper = type(original)(self._wrap(original.__func__, name))
+        else:
+            wrapper = self._wrap(original, name)
+        setattr(owner, attribute, wrapper)
+        self._patched.append((owner, attribute, original))
+
+    def restore(self):
+        """Puts back all functions that were replaced."""
+        while self._patched:
+            owner, attribute, original = self._patched.pop()
+            setattr(owner, attribute, original)
+
+    def __enter__(self):
+        for owner, attribute, name in self.stages:
+            self.instrument(owner, attribute, name)
+        return self
+
+    def __exit__(self, *exc):
+        self.restore()
+
+    def split(self):
+        """Starts recording anew, e.g. for the next pass over the corpus.
+
+        Returns:
+            dict: Statistics that were recorded since the last split, stage name -> [calls, seconds, net retained blocks].
+        """
+        stats, self.stats = self.stats, dict()
+        return stats
+
+    @staticmethod
+    def combine(*sections):
+        """Adds up the statistics of several sections that were returned by split."""
+        combined = dict()
+        for section in sections:
+            for name, values in section.items():
+                combined[name] = [total + value for total, value in zip(combined.get(name, [0, 0.0, 0]), values)]
+        return combined
+
+    def summary(self, names=None, stats=None):
+        """Gets the statistics of stages, the slowest first.
+
+        Args:
+            names (Iterable[str], optional): Stages that are included, None for all. Defaults to None.
+            stats (dict, optional): Statistics of sections, e.g. combined ones, None for the current ones. Defaults to None.
+
+        Returns:
+            List[dict]: Name, calls, seconds and net retained blocks of each stage that was run.
+                Net retained blocks is the number of memory blocks that stayed allocated after the calls,
+                minus the ones that were freed.
+        """
+        stats = self.stats if stats is None else stats
+        names = stats if names is None else [name for name in names if name in stats]
+        rows = [{"stage": name, "calls": stats[name][0], "seconds": stats[name][1],
+                 "net_retained_blocks": stats[name][2]} for name in names]
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
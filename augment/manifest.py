@@ -0,0 +1,108 @@
+# This file contains a manifest of the experiments in an output directory, so unchanged experiments are not run again.
+from hashlib import sha256
+import json
+import os
+
+from .cache import file_hash, file_signature
+
+MANIFEST_VERSION = 1
+
+def code_version(paths=()):
+    """Gets a hash of the source code that generates the augmented data.
+
+    Args:
+        paths (Iterable[str], optional): Further source files besides the augment package, e.g. main.py. Defaults to ().
+
+    Returns:
+        str: Hex digest that changes whenever one of the files changes.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    sources = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".py"))
+    digest = sha256()
+    for source in sources + sorted(os.path.abspath(path) for path in paths):
+        digest.update(os.path.basename(source).encode("utf-8"))
+        digest.update(file_hash(source).encode("ascii"))
+    return digest.hexdigest()
+
+def experiment_key(input_hash, config, seed, options, code):
+    """Gets the key of the output of an experiment, which only changes if the output could change.
+
+    Args:
+        input_hash (str): Hash of the content of the input file.
+        config (dict): Techniques of the experiment with their parameters, as in experiments.yaml.
+        seed (int): Global random seed.
+        options (dict): Command line options that change the output, e.g. the compression.
+        code (str): Version of the code, see code_version.
+
+    Returns:
+        str: Hex digest of all values.
+    """
+    values = {"version": MANIFEST_VERSION, "input": input_hash, "config": config, "seed": seed,
+              "options": options, "code": code}
+    return sha256(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class Manifest:
+
+    def __init__(self, out_dir):
+        """Loads the manifest of an output directory, which is empty if there is none.
+
+        The manifest stores the key and the output file of every experiment that was completed.
+
+        Args:
+            out_dir (str): Output directory with a subdirectory for every experiment.
+        """
+        self.out_dir = out_dir
+        self.path = os.path.join(out_dir, "manifest.json")
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            manifest = dict()
+        if manifest.get("version") != MANIFEST_VERSION:
+            manifest = dict()
+        self.input = manifest.get("input")
+        self.experiments = manifest.get("experiments", dict())
+
+    def input_hash(self, path):
+        """Gets the hash of the content of the input file.
+
+        The content is only hashed again if its size or modification time changed since the last run.
+
+        Args:
+            path (str): Path of the input file.
+
+        Returns:
+            str: sha1 hash of the content.
+        """
+        signature = file_signature(path, content_hash=False)
+        if self.input is None or any(self.input.get(name) != value for name, value in signature.items()):
+            self.input = file_signature(path)
+        return self.input["sha1"]
+
+    def is_current(self, name, key):
+        """Checks whether an experiment was completed with the same key and its output still exists."""
+        entry = self.experiments.get(name)
+        return (entry is not None and entry["key"] == key
+                and os.path.exists(os.path.join(self.out_dir, name, entry["file"])))
+
+    def invalidate(self, names):
+        """Removes experiments from the manifest before their output is overwritten and saves it."""
+        for name in names:
+            self.experiments.pop(name, None)
+        self.save()
+
+    def record(self, name, key, file, n_augmented):
+        """Adds a completed experiment.
+
+        Args:
+            name (str): Name of the experiment.
+            key (str): Key of the experiment, see experiment_key.
+            file (str): Name of the output file in the directory of the experiment.
+            n_augmented (int): Number of augmented sentences that were generated.
+        """
+        self.experiments[name] = {"key": key, "file": file, "n_augmented": n_augmented}
+
+    def save(self):
+        with open(self.path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"version": MANIFEST_VERSION, "input": self.input, "experiments": self.experiments}, file, indent=2)
+        os.replace(self.path + ".tmp", self.path)
@@ -0,0 +1,683 @@
+# This file contains functions that run augmentation experiments over a whole corpus.
+from collections import deque
+from hashlib import blake2b
+from itertools import islice
+import json
+from multiprocessing import Pool
+from queue import Empty, Full, Queue
+import threading
+import time
+
+import numpy as np
+
+from .augment import SEED
+from .data import CachedSentences, Sentence
+
+CHUNK_SIZE = 64 # Number of sentences that are sent to a worker process at once.
+
+QUEUE_SIZE = 8 # Number of chunks that can wait between two stages of a pipelined run.
+
+_worker_augment = None # Augment object of a worker process, set by _init_worker.
+_worker_sentences = None # Cached sentences of a worker process, set by _init_worker.
+_DONE = object() # Put into a queue after the last chunk.
+
+# Augmentation techniques in the order they are applied, with the Augment method that generates them.
+TECHNIQUES = {"rotate": "generate_rotations", "crop": "generate_crops", "nonce": "generate_nonce"}
+
+def sentence_seed(seed, key, index):
+    """Derives the seed for one sentence of an augmentation task.
+
+    The seed only depends on the arguments, so the result does not depend on
+    the order in which sentences are augmented or on the process that augments them.
+
+    Args:
+        seed (int): Global seed.
+        key (str): Key of the augmentation task, see task_key.
+        index (int): Position of the sentence in the corpus.
+
+    Returns:
+        int: Seed for the random number generator.
+    """
+    key = "{}\t{}\t{}".format(seed, key, index).encode("utf-8")
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), "little")
+
+def task_key(technique, kwargs):
+    """Gets a key that is the same for the same technique with the same parameters."""
+    return technique + json.dumps(kwargs, sort_keys=True)
+
+def seed_task(augment, seed, key, technique, index, sentence):
+    """Seeds the random numbers of augment for running one task on a sentence.
+
+    Crops and nonces take their numbers from a batch of sentences, see BatchedDraws, rotations use augment.rng.
+
+    Args:
+        augment (Augment): Augment object that runs the task next.
+        seed (int): Global seed.
+        key (str): Key of the augmentation task, see task_key.
+        technique (str): Name of the technique, e.g. "rotate".
+        index (int): Position of the sentence in the corpus.
+        sentence (Sentence): Sentence that is augmented.
+    """
+    if technique == "rotate":
+        augment.rng.seed(sentence_seed(seed, key, index))
+    else:
+        augment.seed_chunks(seed, key, index, sentence)
+
+def tag(augmentations, source_id, technique):
+    """Adds comments to augmented sentences with their own id, the id of their source and the technique.
+
+    Args:
+        augmentations (List[Sentence]): Sentences generated from the same source by one technique.
+        source_id (str): Id of the source sentence.
+        technique (str): Name of the technique, e.g. "rotate".
+    """
+    for k, aug in enumerate(augmentations, start=1):
+        aug.comments = ("# sent_id = {}-{}{}".format(source_id, technique, k),
+                        "# source_sent_id = {}".format(source_id),
+                        "# augmentation = {}".format(technique))
+
+class Plan:
+
+    def __init__(self, experiments, comments=True):
+        """Plans the augmentation tasks that have to be run for a set of experiments.
+
+        A task is one technique with its parameters. Tasks that are shared by
+        several experiments are only run once per sentence, e.g. the rotations of
+        'rotate-n2-informed' and 'comb-rot-crop'.
+
+        Args:
+            experiments (dict): Experiment names mapped to their configuration.
+            comments (bool, optional): Whether the output contains comments, multiword tokens and empty nodes.
+                Defaults to True.
+        """
+        self.comments = comments
+        self.profiler = None # Profiler that measures every task, only in the main process.
+        self.tasks = dict() # Task key -> (technique, kwargs)
+        self.experiments = dict() # Experiment name -> List of task keys.
+        for name, config in experiments.items():
+            keys = []
+            for technique in TECHNIQUES:
+                kwargs = config.get(technique, False)
+                if kwargs is False:
+                    continue
+                kwargs = kwargs or dict() # Technique without parameters.
+                key = task_key(technique, kwargs)
+                self.tasks.setdefault(key, (technique, kwargs))
+                keys.append(key)
+            self.experiments[name] = keys
+
+    def uses(self, technique):
+        """Whether any experiment uses the technique."""
+        return any(t == technique for t, _ in self.tasks.values())
+
+    def generate(self, augment, sentence, index, seed):
+        """Runs all tasks on a sentence and combines their results per experiment.
+
+        Args:
+            augment (Augment): Augment object that generates the new sentences.
+            sentence (Sentence): Sentence that should be augmented.
+            index (int): Position of the sentence in the corpus.
+            seed (int): Global seed.
+
+        Returns:
+            Dict[str, Dict[Sentence, str]]: For each experiment the distinct augmentations of the sentence,
+                without the sentence itself, mapped to their technique.
+        """
+        generated = dict()
+        for key, (technique, kwargs) in self.tasks.items():
+            seed_task(augment, seed, key, technique, index, sentence)
+            generate = getattr(augment, TECHNIQUES[technique])
+            if self.profiler is None:
+                generated[key] = generate(sentence=sentence, **kwargs)
+            else:
+                with self.profiler.stage(key):
+                    generated[key] = generate(sentence=sentence, **kwargs)
+            if self.comments:
+                tag(generated[key], sentence.sent_id or "s{}".format(index + 1), technique)
+        results = dict()
+        for name, keys in self.experiments.items():
+            augs = dict() # Augmentation -> technique, keeps the order, so the output does not depend on hashing.
+            for key in keys:
+                technique = self.tasks[key][0]
+                for aug in generated[key]:
+                    augs.setdefault(aug, technique)
+            augs.pop(sentence, None) # Avoid writing the same sentence twice to the output.
+            results[name] = augs
+        return results
+
+    def run(self, augment, sentence, index, seed):
+        """Runs all tasks on a sentence and formats the results of every experiment.
+
+        Args:
+            augment (Augment): Augment object that generates the new sentences.
+            sentence (Sentence): Sentence that should be augmented.
+            index (int): Position of the sentence in the corpus.
+            seed (int): Global seed.
+
+        Returns:
+            Dict[str, List[Tuple[int, str, str]]]: For each experiment the fingerprint, the technique and the
+                formatted text of the sentence followed by those of its distinct augmentations. The technique of
+                the sentence itself is None.
+        """
+        formatted = {id(sentence): sentence.to_conll(self.comments) + "\n"} # Every sentence is only formatted once.
+        results = dict()
+        for name, augs in self.generate(augment, sentence, index, seed).items():
+            for aug in augs:
+                if id(aug) not in formatted:
+                    formatted[id(aug)] = aug.to_conll(self.comments) + "\n"
+            results[name] = [(sentence.fingerprint, None, formatted[id(sentence)])]
+            results[name].extend((aug.fingerprint, technique, formatted[id(aug)]) for aug, technique in augs.items())
+        return results
+
+class Budget:
+
+    def __init__(self, config):
+        """Target size of an experiment and how it is split between its techniques.
+
+        The configuration of the experiment has a 'budget' with either 'sentences' or 'tokens',
+        the number of augmented sentences or tokens that should be generated, and optionally a 'mix'
+        with the share of each technique. Without mix, every technique gets the same share.
+
+        Args:
+            config (dict): Configuration of the experiment.
+
+        Raises:
+            ValueError: If the budget has both or none of sentences and tokens, or the mix contains
+                a technique that is not configured.
+        """
+        budget = config["budget"]
+        if ("sentences" in budget) == ("tokens" in budget):
+            raise ValueError("A budget needs either a number of sentences or a number of tokens.")
+        self.unit = "sentences" if "sentences" in budget else "tokens"
+        self.size = budget[self.unit]
+        self.tasks = dict() # Technique -> kwargs
+        for technique in TECHNIQUES:
+            kwargs = config.get(technique, False)
+            if kwargs is not False:
+                self.tasks[technique] = kwargs or dict()
+        mix = budget.get("mix") or dict.fromkeys(self.tasks, 1)
+        unknown = set(mix) - set(self.tasks)
+        if unknown:
+            raise ValueError("The mix contains techniques that are not configured: {}".format(", ".join(sorted(unknown))))
+        # Rounding the cumulative shares makes the quotas add up to the size exactly.
+        total = sum(mix.values())
+        self.quotas = dict()
+        cumulative = 0
+        for technique in self.tasks:
+            start = round(self.size * cumulative / total)
+            cumulative += mix.get(technique, 0)
+            self.quotas[technique] = round(self.size * cumulative / total) - start
+        self.used = dict.fromkeys(self.tasks, 0) # Sentences or tokens that were generated per technique.
+        self.keys = {technique: task_key(technique, kwargs) for technique, kwargs in self.tasks.items()}
+        self.profiler = None # Profiler that measures every task.
+
+    def cost(self, sentence):
+        return 1 if self.unit == "sentences" else len(sentence)
+
+def augment_budget(augment, corpus, budget, seed=SEED, comments=True, seen=None):
+    """Augments sentences until the budget of an experiment is used up.
+
+    Sentences are visited by descending Augment.priority, so sentences with many flexible chunks
+    or rare relations are augmented first, and generation stops as soon as every technique has
+    reached its quota. A streamed corpus is visited in file order. Every sentence is seeded like
+    in Plan.run.
+
+    Args:
+        augment (Augment): Augment object that generates the new sentences.
+        corpus (Corpus): Sentences that should be augmented.
+        budget (Budget): Size and mix of the experiment, its used counts are updated.
+        seed (int, optional): Global seed. Defaults to SEED.
+        comments (bool, optional): Whether the output contains comments, multiword tokens and empty nodes.
+            Defaults to True.
+        seen (FingerprintSet, optional): Fingerprints of sentences that must not be generated again,
+            new sentences are added. Defaults to None.
+
+    Yields:
+        List[Tuple[str, str]]: For every sentence of the corpus in corpus order, the technique and the formatted
+            text of the sentence followed by those of its augmentations. The technique of the sentence itself is None.
+    """
+    if corpus.stream:
+        visits = enumerate(corpus)
+    else:
+        flexible = budget.tasks.get("rotate", dict()).get("flexible")
+        priorities = [augment.priority(sentence, flexible) for sentence in corpus]
+        order = sorted(range(len(priorities)), key=lambda i: -priorities[i]) # Stable, ties stay in corpus order.
+        visits = ((index, corpus[index]) for index in order)
+    remaining = dict(budget.quotas)
+    selected = dict() # Sentence index -> formatted augmentations
+    for index, sentence in visits:
+        if all(left <= 0 for left in remaining.values()):
+            break
+        texts = []
+        chosen = {sentence: None} # Avoids duplicates of the sentence and between techniques.
+        for technique, kwargs in budget.tasks.items():
+            if remaining[technique] <= 0:
+                continue
+            key = budget.keys[technique]
+            seed_task(augment, seed, key, technique, index, sentence)
+            generate = getattr(augment, TECHNIQUES[technique])
+            if budget.profiler is None:
+                augs = generate(sentence=sentence, **kwargs)
+            else:
+                with budget.profiler.stage(key):
+                    augs = generate(sentence=sentence, **kwargs)
+            if comments:
+                tag(augs, sentence.sent_id or "s{}".format(index + 1), technique)
+            for aug in augs:
+                if remaining[technique] <= 0:
+                    break
+                if aug in chosen or (seen is not None and not seen.add(aug.fingerprint)):
+                    continue
+                chosen[aug] = None
+                cost = budget.cost(aug)
+                remaining[technique] -= cost
+                budget.used[technique] += cost
+                texts.append((technique, aug.to_conll(comments) + "\n"))
+        if texts:
+            selected[index] = texts
+    for index, sentence in enumerate(corpus):
+        yield [(None, sentence.to_conll(comments) + "\n"), *selected.get(index, ())]
+
+def _augment_chunk(augment, chunk, plan, seed):
+    """Augments a list of (index, sentence) pairs.
+
+    Returns:
+        List[Dict[str, List[Tuple[int, str, str]]]]: Results of Plan.run for each sentence.
+    """
+    return [plan.run(augment, sentence, index, seed) for index, sentence in chunk]
+
+def _init_worker(augment, sentences=None):
+    global _worker_augment, _worker_sentences
+    _worker_augment = augment
+    _worker_sentences = sentences
+    if sentences is not None:
+        sentences.vocab = augment.vocab # Same ids, the vocabulary of the corpus only grew after the cache.
+
+def _cached(corpus):
+    """Gets the sentences of a corpus that worker processes can map from its cache themselves, None if there are none."""
+    sentences = getattr(corpus, "sentences", None)
+    if isinstance(sentences, CachedSentences) and sentences.path is not None:
+        return sentences
+    return None
+
+def _start_pool(augment, plan, workers, corpus=None):
+    """Starts worker processes that augment sentences with a copy of augment.
+
+    If the corpus is memory-mapped from a cache, every worker maps it as well, see _packed_chunks.
+    """
+    if plan.uses("nonce"):
+        augment.nonce_index() # Build before the workers start, so it is only built once.
+    return Pool(workers, initializer=_init_worker, initargs=(augment, _cached(corpus)))
+
+def _pack(chunk):
+    """Packs (index, sentence) pairs for a worker process, sentences are sent as arrays without the vocabulary."""
+    return [(index, sentence.arrays(), sentence.comments, sentence.extras) for index, sentence in chunk]
+
+def _packed_chunks(corpus, order=None):
+    """Splits a corpus into packed chunks for worker processes.
+
+    Sentences of a memory-mapped cache are only sent as their index, the workers read them from their
+    own map of the cache, so the sentences are neither created nor pickled in this process.
+
+    Args:
+        corpus (Iterable[Sentence]): Sentences that should be augmented.
+        order (List[int], optional): Indices of the sentences in the order they are augmented,
+            None for corpus order. Defaults to None.
+
+    Yields:
+        list: Chunks for _unpack.
+    """
+    if _cached(corpus) is not None:
+        indices = range(len(corpus)) if order is None else order
+        for start in range(0, len(indices), CHUNK_SIZE):
+            yield list(indices[start:start + CHUNK_SIZE])
+        return
+    for chunk in _chunks(corpus, CHUNK_SIZE, order):
+        yield _pack(chunk)
+
+def _unpack(chunk):
+    """Creates the (index, sentence) pairs of a packed chunk, with the vocabulary of the worker process."""
+    if chunk and isinstance(chunk[0], int): # Indices of cached sentences.
+        return [(index, _worker_sentences[index]) for index in chunk]
+    vocab = _worker_augment.vocab
+    return [(index, Sentence(vocab, *arrays, comments=comments, extras=extras))
+            for index, arrays, comments, extras in chunk]
+
+def _work(task):
+    """Augments a chunk in a worker process. Sentences are sent as arrays without the vocabulary."""
+    plan, seed, chunk = task
+    return _augment_chunk(_worker_augment, _unpack(chunk), plan, seed)
+
+def _chunks(corpus, size, order=None):
+    """Splits corpus into lists of (index, sentence) pairs, in the given order of indices or in corpus order."""
+    if order is not None:
+        for start in range(0, len(order), size):
+            yield [(index, corpus[index]) for index in order[start:start + size]]
+        return
+    iterator = enumerate(corpus)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+def augment_corpus(augment, corpus, plan, seed=SEED, workers=1):
+    """Augments every sentence of a corpus for all experiments of a plan in one pass.
+
+    The random number generator is seeded for every sentence and task from the global seed,
+    the task key and the sentence index, so the output is the same for any number of workers
+    and an experiment's output does not depend on which other experiments are run.
+
+    Args:
+        augment (Augment): Augment object that generates the new sentences.
+        corpus (Iterable[Sentence]): Sentences that should be augmented.
+        plan (Plan): Experiments and their tasks.
+        seed (int, optional): Global seed. Defaults to SEED.
+        workers (int, optional): Number of worker processes, 1 augments in this process. Defaults to 1.
+
+    Yields:
+        Dict[str, List[Tuple[int, str, str]]]: Results of Plan.run for each sentence, in corpus order.
+    """
+    if workers <= 1:
+        for chunk in _chunks(corpus, CHUNK_SIZE):
+            yield from _augment_chunk(augment, chunk, plan, seed)
+        return
+    with _start_pool(augment, plan, workers, corpus) as pool:
+        pending = deque()
+        for chunk in _packed_chunks(corpus):
+            pending.append(pool.apply_async(_work, ((plan, seed, chunk),)))
+            if len(pending) >= 2 * workers: # Do not read further ahead than the workers can keep up with.
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+class StageCounter:
+
+    def __init__(self, name):
+        """Counts what one stage of a pipelined run did and how full its input queue was.
+
+        Args:
+            name (str): Name of the stage.
+        """
+        self.name = name
+        self.sentences = 0
+        self.seconds = 0.0 # Time the stage was busy, without waiting for other stages.
+        self.depth_total = 0
+        self.depth_max = 0
+        self.samples = 0
+
+    def sample(self, queue):
+        """Records the number of chunks that are waiting in the input queue."""
+        depth = queue.qsize()
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.samples += 1
+
+    def summary(self):
+        return {"stage": self.name, "sentences": self.sentences, "seconds": self.seconds,
+                "sentences_per_s": self.sentences / self.seconds if self.seconds > 0 else None,
+                "mean_queue_depth": self.depth_total / self.samples if self.samples else None,
+                "max_queue_depth": self.depth_max}
+
+def _work_timed(task):
+    """Augments a chunk in a worker process and measures how long it took."""
+    start = time.perf_counter()
+    results = _work(task)
+    return results, time.perf_counter() - start
+
+def augment_pipelined(augment, corpus, plan, consume, seed=SEED, workers=1, queue_size=QUEUE_SIZE):
+    """Augments a corpus like augment_corpus, with reading, augmenting and writing running at the same time.
+
+    A reader thread parses chunks of sentences, the calling thread augments them or hands them to
+    worker processes and a writer thread passes the results to consume. The stages are connected by
+    queues that hold at most queue_size chunks, so a fast stage waits for a slow one instead of
+    filling the memory. The results are consumed in corpus order.
+
+    Args:
+        augment (Augment): Augment object that generates the new sentences.
+        corpus (Iterable[Sentence]): Sentences that should be augmented.
+        plan (Plan): Experiments and their tasks.
+        consume (Callable[[Dict[str, List[Tuple[int, str, str]]]], None]): Called in the writer thread with
+            the results of Plan.run for each sentence, e.g. writes them to files.
+        seed (int, optional): Global seed. Defaults to SEED.
+        workers (int, optional): Number of worker processes, 1 augments in this process. Defaults to 1.
+        queue_size (int, optional): Maximum number of chunks in each queue. Defaults to QUEUE_SIZE.
+
+    Returns:
+        List[StageCounter]: Counters of the read, augment and write stages.
+
+    Raises:
+        ValueError: If queue_size is less than 1, which would make the queues unbounded.
+    """
+    if queue_size < 1:
+        raise ValueError("The queue size must be at least 1, got {}.".format(queue_size))
+    read, work, write = StageCounter("read"), StageCounter("augment"), StageCounter("write")
+    chunks, results = Queue(queue_size), Queue(queue_size)
+    stop = threading.Event() # Set when a stage fails, so the others do not wait forever.
+    errors = []
+
+    def put(queue, item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def get(queue):
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return _DONE
+
+    def reader():
+        try:
+            # Chunks for workers are packed like in augment_corpus.
+            iterator = _packed_chunks(corpus) if workers > 1 else _chunks(corpus, CHUNK_SIZE)
+            while True:
+                start = time.perf_counter()
+                chunk = next(iterator, None)
+                read.seconds += time.perf_counter() - start
+                if chunk is None:
+                    break
+                read.sentences += len(chunk)
+                put(chunks, chunk)
+                if stop.is_set():
+                    break
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            put(chunks, _DONE)
+
+    def writer():
+        try:
+            while True:
+                write.sample(results)
+                item = get(results)
+                if item is _DONE:
+                    break
+                if workers > 1:
+                    item, seconds = item.get()
+                    work.seconds += seconds
+                start = time.perf_counter()
+                for sent_results in item:
+                    consume(sent_results)
+                write.seconds += time.perf_counter() - start
+                write.sentences += len(item)
+        except BaseException as error:
+            errors.append(error)
+            stop.set()
+
+    pool = _start_pool(augment, plan, workers, corpus) if workers > 1 else None
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            work.sample(chunks)
+            chunk = get(chunks)
+            if chunk is _DONE:
+                break
+            work.sentences += len(chunk)
+            if pool is not None: # The writer waits for the result, in order.
+                put(results, pool.apply_async(_work_timed, ((plan, seed, chunk),)))
+            else:
+                start = time.perf_counter()
+                augmented = _augment_chunk(augment, chunk, plan, seed)
+                work.seconds += time.perf_counter() - start
+                put(results, augmented)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        put(results, _DONE)
+        for thread in threads:
+            thread.join()
+        if pool is not None:
+            if stop.is_set():
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+    if errors:
+        raise errors[0]
+    return [read, work, write]
+
+def _stream_items(augment, chunk, plan, seed, output, originals):
+    """Augments a list of (index, sentence) pairs for EpochStream.
+
+    Returns:
+        list: Items of every sentence in the format of output, "parts" are the arguments of Sentence
+            after the vocabulary, so sentences can be sent between processes without it.
+    """
+    items = []
+    for index, sentence in chunk:
+        augs = plan.generate(augment, sentence, index, seed)[EpochStream.NAME]
+        for sent in ((sentence, *augs) if originals else augs):
+            if output == "sentences":
+                items.append(sent)
+            elif output == "conll":
+                items.append(sent.to_conll(plan.comments) + "\n")
+            elif output == "arrays":
+                items.append(sent.arrays())
+            else:
+                items.append((sent.arrays(), sent.comments, sent.extras))
+    return items
+
+def _work_stream(task):
+    """Augments a chunk for EpochStream in a worker process."""
+    plan, seed, chunk, output, originals = task
+    return _stream_items(_worker_augment, _unpack(chunk), plan, seed, output, originals)
+
+class EpochStream:
+
+    NAME = "stream" # Name of the only experiment of the plan.
+    OUTPUTS = ("sentences", "conll", "arrays")
+
+    def __init__(self, augment, corpus, config, batch_size=32, output="sentences", originals=True, shuffle=False,
+                 workers=0, prefetch=2, comments=True):
+        """Augments a corpus on the fly, with new augmentations in every epoch of a training loop.
+
+        The worker processes are started on the first epoch and reused by the following ones, so the
+        position statistics and the nonce index are only built and sent to them once. Every sentence
+        is seeded like in Plan.run, with the epoch seed as global seed, so an epoch is the same for
+        any number of workers.
+
+        Args:
+            augment (Augment): Augment object that generates the new sentences.
+            corpus (Corpus): Sentences that should be augmented, with the same vocabulary as augment.
+            config (dict): Techniques with their parameters, like an experiment in experiments.yaml.
+            batch_size (int, optional): Number of sentences per batch. Defaults to 32.
+            output (str, optional): "sentences" for Sentence objects, "conll" for formatted strings or "arrays"
+                for the arrays of Sentence.arrays with ids of augment.vocab. Defaults to "sentences".
+            originals (bool, optional): Whether every sentence is followed by its augmentations. Otherwise,
+                only augmentations are returned. Defaults to True.
+            shuffle (bool, optional): Whether the sentences are visited in a new random order every epoch.
+                Not possible for streamed corpora. Defaults to False.
+            workers (int, optional): Number of worker processes, 0 augments in the calling process. Defaults to 0.
+            prefetch (int, optional): Number of chunks per worker that are augmented ahead of the
+                training loop. Defaults to 2.
+            comments (bool, optional): Whether sentences have comments with their id, source and technique.
+                Defaults to True.
+
+        Raises:
+            ValueError: If output is unknown or a streamed corpus should be shuffled.
+        """
+        if output not in self.OUTPUTS:
+            raise ValueError("Unknown output '{}', use one of {}.".format(output, ", ".join(self.OUTPUTS)))
+        if shuffle and corpus.stream:
+            raise ValueError("A streamed corpus can not be shuffled.")
+        self.augment = augment
+        self.corpus = corpus
+        self.plan = Plan({self.NAME: config}, comments=comments)
+        self.batch_size = batch_size
+        self.output = output
+        self.originals = originals
+        self.shuffle = shuffle
+        self.workers = workers
+        self.prefetch = prefetch
+        self.pool = None
+
+    def _order(self, epoch_seed):
+        """Gets the indices of the sentences in the order of an epoch, None for corpus order."""
+        if not self.shuffle:
+            return None
+        return np.random.default_rng(epoch_seed).permutation(len(self.corpus)).tolist()
+
+    def _items(self, epoch_seed):
+        """Yields the items of every chunk of an epoch, augmented ahead by the workers if there are any."""
+        if self.workers <= 0:
+            for chunk in _chunks(self.corpus, CHUNK_SIZE, self._order(epoch_seed)):
+                yield _stream_items(self.augment, chunk, self.plan, epoch_seed, self.output, self.originals)
+            return
+        if self.pool is None:
+            self.pool = _start_pool(self.augment, self.plan, self.workers, self.corpus)
+        output = "parts" if self.output == "sentences" else self.output
+        vocab = self.augment.vocab
+        pending = deque()
+        def collect():
+            items = pending.popleft().get()
+            if output == "parts":
+                items = [Sentence(vocab, *arrays, comments=comments, extras=extras)
+                         for arrays, comments, extras in items]
+            return items
+        for chunk in _packed_chunks(self.corpus, self._order(epoch_seed)):
+            task = (self.plan, epoch_seed, chunk, output, self.originals)
+            pending.append(self.pool.apply_async(_work_stream, (task,)))
+            if len(pending) >= self.prefetch * self.workers:
+                yield collect()
+        while pending:
+            yield collect()
+
+    def epoch(self, epoch_seed):
+        """Augments the corpus for one epoch.
+
+        Args:
+            epoch_seed (int): Seed of the epoch, every epoch should have its own.
+
+        Yields:
+            list: Batches of batch_size sentences in the format of output, the last one can be smaller.
+        """
+        batch = []
+        for items in self._items(epoch_seed):
+            for item in items:
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
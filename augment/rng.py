@@ -0,0 +1,81 @@
+# This file contains random numbers that are drawn for batches of sentences at once.
+from hashlib import blake2b
+
+import numpy as np
+
+BATCH_SIZE = 64 # Number of consecutive sentences whose numbers are drawn together.
+SLOTS = 32 # Numbers per sentence and row that come from the stream of the task, longer sentences draw the rest.
+
+def _entropy(seed, key, *values):
+    """Gets the entropy of a NumPy SeedSequence for a task, which is independent of the other tasks."""
+    key = int.from_bytes(blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return [seed, key, *values]
+
+class _TaskStream:
+
+    __slots__ = ("seed", "bit_generator", "generator", "position", "batch", "draws")
+
+    def __init__(self, seed, key):
+        """Stream of random numbers of one task, where sentence i owns the numbers i * 2 * SLOTS to (i + 1) * 2 * SLOTS."""
+        self.seed = seed
+        self.bit_generator = np.random.PCG64(np.random.SeedSequence(_entropy(seed, key)))
+        self.generator = np.random.Generator(self.bit_generator)
+        self.position = 0 # Number of values that were drawn from the bit generator.
+        self.batch = None # Number of the batch that was drawn last.
+        self.draws = None # Its numbers, array of shape (BATCH_SIZE, 2, SLOTS).
+
+    def draw(self, sentence, n_sentences):
+        """Draws the numbers of consecutive sentences, jumps to the first one in constant time."""
+        start = sentence * 2 * SLOTS
+        self.bit_generator.advance((start - self.position) % (1 << 128)) # Backwards wraps around the period.
+        self.position = start + n_sentences * 2 * SLOTS
+        return self.generator.random((n_sentences, 2, SLOTS))
+
+class BatchedDraws:
+
+    def __init__(self):
+        """Uniform random numbers for the chunks of sentences, drawn for a batch of sentences in one call.
+
+        Every task has its own NumPy PCG64 stream, in which each sentence has a fixed range of numbers
+        given by its position in the corpus. The numbers of a sentence therefore only depend on the seed,
+        the task and its position, not on which sentences are augmented together or by which process.
+        Sentences that are visited in corpus order get their numbers from one draw for their whole
+        batch of BATCH_SIZE sentences. Sentences in any other order, e.g. by priority or shuffled, only
+        draw their own range, since the stream can jump to it without drawing the numbers in between.
+        Only the stream and the current batch of every task are kept.
+        """
+        self._streams = dict() # Task key -> _TaskStream
+
+    def sentence(self, seed, key, index, n):
+        """Gets the numbers of one sentence.
+
+        Args:
+            seed (int): Global seed.
+            key (str): Key of the augmentation task, see pipeline.task_key.
+            index (int): Position of the sentence in the corpus.
+            n (int): Number of chunks of the sentence.
+
+        Returns:
+            np.ndarray: Array of shape (2, n) with numbers in [0, 1). Row 0 decides whether a chunk
+                is changed, row 1 which candidate is chosen.
+        """
+        stream = self._streams.get(key)
+        if stream is None or stream.seed != seed:
+            stream = self._streams[key] = _TaskStream(seed, key)
+        batch, row = divmod(index, BATCH_SIZE)
+        if stream.batch == batch:
+            draws = stream.draws[row]
+        elif row == 0 or stream.batch == batch - 1: # Visited in corpus order, draw the whole batch.
+            stream.batch = batch
+            stream.draws = stream.draw(batch * BATCH_SIZE, BATCH_SIZE)
+            draws = stream.draws[row]
+        else:
+            draws = stream.draw(index, 1)[0]
+        if n <= SLOTS:
+            return draws[:, :n]
+        rest = np.random.default_rng(_entropy(seed, key, index)).random((2, n - SLOTS))
+        return np.concatenate((draws, rest), axis=1)
+
+    def __getstate__(self):
+        """Leaves out the streams when pickled, e.g. when shipped to worker processes."""
+        return {"_streams": dict()}
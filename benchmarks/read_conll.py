@@ -0,0 +1,54 @@
+# Compares reading a conll file through nltk.DependencyGraph with the native reader.
+# Run from the repository root: python -m benchmarks.read_conll
+import argparse
+import time
+
+from nltk.parse import DependencyGraph
+
+from augment.data import Corpus, Sentence, Vocab
+
+def read_nltk(path):
+    """Reads sentences like the reader before the native one: every sentence is parsed by nltk."""
+    vocab = Vocab()
+    sents = []
+    with open(path, encoding="utf-8") as file:
+        sent = ""
+        for line in file:
+            if line.strip():
+                if not line.startswith("#"):
+                    sent += line
+            else:
+                sents.append(sent)
+                sent = ""
+    return [Sentence.from_dependency_graph(DependencyGraph(s, top_relation_label="root"), vocab)
+            for s in sents if s]
+
+def read_native(path):
+    return Corpus(path).sentences
+
+def best_time(function, path, repeat):
+    """Runs function repeat times, returns the fastest time and the last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(path)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog='BenchReadConll',
+                    description='Benchmark reading conll files.')
+    parser.add_argument('--input', default="corpora/data-26k/de_gsd-ud-train.conllu")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    results = dict()
+    for name, function in (("nltk", read_nltk), ("native", read_native)):
+        seconds, sents = best_time(function, args.input, args.repeat)
+        n_tokens = sum(len(s) for s in sents)
+        results[name] = seconds
+        print(f"{name:>6}: {seconds:.3f}s, {len(sents)/seconds:,.0f} sentences/s, {n_tokens/seconds:,.0f} tokens/s")
+    print(f"Speedup: {results['nltk']/results['native']:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# Measures throughput and memory of every stage of the augmentation, on the training data or on synthetic corpora.
+# Run from the repository root: python -m benchmarks.suite --json results.json
+# Compare with an earlier run: python -m benchmarks.suite --compare results.json
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import yaml
+
+from augment.augment import Augment
+from augment.data import ConllWriter, Corpus, read_conllu
+from augment.pipeline import Plan, augment_corpus
+
+# Techniques with the parameters they are measured with, named like the stages in the output.
+TECHNIQUES = {
+    "rotate": ("generate_rotations", {"n": 3}),
+    "rotate-informed": ("generate_rotations", {"n": 3, "informed": True}),
+    "crop": ("generate_crops", {"p": 0.5}),
+    "nonce": ("generate_nonce", {"p": 0.5}),
+    "nonce-strict": ("generate_nonce", {"p": 0.5, "strict": True}),
+}
+
+def reset_peak_rss():
+    """Resets the peak resident set size of this process, which is only possible on Linux."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss():
+    """Gets the peak resident set size of this process in MB, since the last reset if possible."""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource # Peak since the start of the process, in kB on Linux but in bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+def measure(function, repeat=1):
+    """Runs one stage and measures its time and peak memory.
+
+    Args:
+        function (Callable[[], Any]): Runs the stage.
+        repeat (int, optional): Number of runs, the fastest one is reported. Defaults to 1.
+
+    Returns:
+        Tuple[float, float, Any]: Seconds, peak RSS in MB over all runs and the return value of the last run.
+    """
+    times, peaks = [], []
+    for _ in range(repeat):
+        reset_peak_rss()
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+        peaks.append(peak_rss())
+    return min(times), max(peaks), result
+
+def synthetic_corpus(path, out_path, n_sentences=None, min_length=0):
+    """Writes a synthetic corpus built from the sentences of a real one.
+
+    Consecutive sentences are joined until they have at least min_length tokens: the root
+    of every further sentence is attached to the first root as parataxis. The sentences are
+    repeated until there are n_sentences.
+
+    Args:
+        path (str): Path of the real corpus.
+        out_path (str): Path of the synthetic corpus.
+        n_sentences (int, optional): Number of sentences, None for one pass over the real corpus. Defaults to None.
+        min_length (int, optional): Minimum number of tokens of each sentence. Defaults to 0.
+    """
+    with open(path, encoding="utf-8") as file:
+        sents = [rows for _, rows, _ in read_conllu(file)]
+    if n_sentences is None:
+        n_sentences = len(sents)
+    with ConllWriter(out_path) as writer:
+        i = 0
+        for k in range(n_sentences):
+            rows, root = [], None
+            while len(rows) == 0 or len(rows) < min_length:
+                offset = len(rows)
+                for fields in sents[i % len(sents)]:
+                    fields = list(fields)
+                    fields[0] = str(int(fields[0]) + offset)
+                    if fields[6] == "0" and root is not None:
+                        fields[6], fields[7] = root, "parataxis"
+                    elif fields[6] != "0":
+                        fields[6] = str(int(fields[6]) + offset)
+                    elif root is None:
+                        root = fields[0]
+                    rows.append("\t".join(fields))
+                i += 1
+            writer.write_text("# sent_id = synthetic-{}\n".format(k + 1) + "\n".join(rows) + "\n\n")
+
+def run(path, config, repeat=1):
+    """Measures every stage on a corpus.
+
+    Args:
+        path (str): Path of the input corpus.
+        config (str): Path of the experiment configuration for the whole pipeline.
+        repeat (int, optional): Number of runs of each stage, the fastest one is reported. Defaults to 1.
+
+    Returns:
+        Tuple[dict, List[dict]]: Size of the corpus and the measurements of every stage.
+    """
+    stages = []
+    def stage(name, function):
+        """Measures a stage that processes every sentence of the corpus once and returns its result."""
+        seconds, peak, result = measure(function, repeat)
+        stages.append({"stage": name, "seconds": seconds, "sentences_per_s": size["sentences"] / seconds,
+                       "tokens_per_s": size["tokens"] / seconds, "peak_rss_mb": peak})
+        return result
+
+    corpus = Corpus(path)
+    size = {"sentences": len(corpus), "tokens": corpus.n_tokens()}
+    stage("read", lambda: Corpus(path))
+    Corpus(path, cache=True) # Creates the cache, only loading it is measured.
+    # Columns are memory-mapped, every sentence is built so that the cache is read like the corpus above.
+    stage("read-cache", lambda: sum(len(sentence) for sentence in Corpus(path, cache=True)))
+
+    def statistics():
+        corpus.sentences = corpus.sentences # Forgets the nonce index.
+        augment = Augment(corpus)
+        augment.nonce_index()
+        return augment
+    augment = stage("statistics", statistics)
+
+    for name, (method, kwargs) in TECHNIQUES.items():
+        def technique():
+            augment.rng.seed(0)
+            augment.generator = np.random.default_rng(0)
+            generate = getattr(augment, method)
+            # Views are lazy, their arrays are built as well so that the work of the technique is measured.
+            return [[aug.arrays() for aug in generate(sentence, **kwargs)] for sentence in corpus]
+        generated = stage(name, technique)
+        stages[-1]["generated"] = sum(len(augs) for augs in generated)
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_path = os.path.join(out_dir, "out.conll")
+        stage("write", lambda: augment.write(dict.fromkeys(corpus, ()), out_path))
+
+    with open(config, encoding="utf-8") as file:
+        plan = Plan(yaml.safe_load(file)["experiments"])
+    def pipeline():
+        return sum(1 for _ in augment_corpus(augment, corpus, plan))
+    stage("pipeline", pipeline)
+    stages[-1]["experiments"] = len(plan.experiments)
+    return size, stages
+
+def commit():
+    """Gets the commit of the repository, None if it is not a git repository."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog='BenchSuite',
+                    description='Benchmark the stages of data augmentation.')
+    parser.add_argument('--input', default="corpora/data-26k/de_gsd-ud-train.conllu")
+    parser.add_argument('--config', default="experiments.yaml")
+    parser.add_argument('--sentences', type=int,
+                        help="Number of sentences of a synthetic corpus built from the input.")
+    parser.add_argument('--min_length', type=int, default=0,
+                        help="Minimum number of tokens per sentence of a synthetic corpus.")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--json', help="Path of a JSON file the results are written to.")
+    parser.add_argument('--compare', help="Path of a JSON file with results of an earlier run.")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.input
+        if args.sentences is not None or args.min_length > 0:
+            path = os.path.join(tmp_dir, "synthetic.conllu")
+            synthetic_corpus(args.input, path, args.sentences, args.min_length)
+        size, stages = run(path, args.config, args.repeat)
+    results = {"commit": commit(), "python": platform.python_version(), "input": args.input,
+               "synthetic": {"sentences": args.sentences, "min_length": args.min_length}, **size, "stages": stages}
+    previous = dict()
+    if args.compare is not None:
+        with open(args.compare, encoding="utf-8") as file:
+            previous = {stats["stage"]: stats for stats in json.load(file)["stages"]}
+    print(f"{size['sentences']} sentences, {size['tokens']} tokens")
+    for stats in stages:
+        line = (f"{stats['stage']:>16}: {stats['seconds']:8.3f}s, {stats['sentences_per_s']:>10,.0f} sentences/s, "
+                f"{stats['tokens_per_s']:>11,.0f} tokens/s, peak RSS {stats['peak_rss_mb']:7.1f} MB")
+        if stats["stage"] in previous:
+            line += f", {stats['tokens_per_s'] / previous[stats['stage']]['tokens_per_s']:.2f}x tokens/s of previous run"
+        print(line)
+    if args.json is not None:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Measures how fast sentences are serialized and written in the conll format.
+# Run from the repository root: python -m benchmarks.write_conll
+import argparse
+import os
+import tempfile
+import time
+
+from augment.data import ConllWriter, Corpus, zstandard
+
+def format_nltk(sentences):
+    """Formats sentences through nltk.DependencyGraph like the writer before the native serializer."""
+    for sent in sentences:
+        sent.to_dependency_graph().to_conll(style=10)
+
+def format_native(sentences):
+    for sent in sentences:
+        sent.to_conll()
+
+def write(sentences, path):
+    with ConllWriter(path) as writer:
+        for sent in sentences:
+            writer.write(sent)
+
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(
+                    prog='BenchWriteConll',
+                    description='Benchmark writing conll files.')
+    parser.add_argument('--input', default="corpora/data-26k/de_gsd-ud-train.conllu")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sentences = Corpus(args.input).sentences
+    n_tokens = sum(len(s) for s in sentences)
+    suffixes = ["", ".gz"] + ([".zst"] if zstandard is not None else [])
+    with tempfile.TemporaryDirectory() as out_dir:
+        benchmarks = [("format nltk", lambda: format_nltk(sentences)),
+                      ("format native", lambda: format_native(sentences))]
+        for suffix in suffixes:
+            path = os.path.join(out_dir, "out.conll" + suffix)
+            benchmarks.append(("write " + (suffix or "plain"), lambda path=path: write(sentences, path)))
+        for name, function in benchmarks:
+            seconds = best_time(function, args.repeat)
+            print(f"{name:>14}: {seconds:.3f}s, {n_tokens/seconds:,.0f} tokens/s")
+
+if __name__ == "__main__":
+    main()
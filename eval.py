@@ -1,29 +1,309 @@
-from nltk.parse import DependencyGraph, DependencyEvaluator
+from multiprocessing import Pool
 from tabulate import tabulate
+import json
 import os
+import time
 import argparse
+import unicodedata
 
-pred_path = "predictions"
-gold_path = "corpora/data-full/de_gsd-ud-test.conllu"
+import numpy as np
 
+from augment.augment import SEED
+from augment.cache import cache_path, file_hash
+from augment.data import comment_value, read_conllu
 
+EVAL_VERSION = 1 # Results in the cache that were computed by another version are not used.
+RESAMPLE_BLOCK = 1000 # Number of resamples that are drawn at once, every block has its own seed.
+PUNCT_CATEGORIES = {"Pc", "Pd", "Ps", "Pe", "Pi", "Pf", "Po"} # Unicode categories that nltk treats as punctuation.
+
+_worker_gold = None # Gold standard of a worker process, set by _init_worker.
 
 def read_conll(path):
+    """Reads the words, heads and relations of a conll file, keyed by the sent_id of each sentence.
+    Sentences without sent_id are keyed by their position."""
     sent_dict = dict()
     with open(path, encoding="utf-8") as file:
-        sent = ""
-        sent_id = None
-        for line in file:
-            if line.strip():
-                if line.startswith("#"):
-                    sent_id = line
-                else:
-                    sent += line
-            else: # Empty line means a new sentence will start.
-                sent_dict[sent_id] = DependencyGraph(sent, top_relation_label="root")
-                sent = ""
+        for comments, rows, _ in read_conllu(file):
+            sent_id = comment_value(comments, "sent_id")
+            if sent_id is None:
+                sent_id = len(sent_dict)
+            sent_dict[sent_id] = ([fields[1] for fields in rows], [int(fields[6]) for fields in rows],
+                                  [fields[7] for fields in rows])
     return sent_dict
 
+def is_punct(word):
+    """Whether a word only consists of punctuation, like in nltk.DependencyEvaluator."""
+    return all(unicodedata.category(char) in PUNCT_CATEGORIES for char in word)
+
+class Scores:
+
+    def __init__(self, sentences, relations, rel_counts):
+        """Counts of scored tokens and correct attachments of a prediction file.
+
+        Args:
+            sentences (np.ndarray): Integer array of shape (3, n_sentences) with the number of scored tokens,
+                correct heads and correct heads and relations of every sentence.
+            relations (List[str]): Relations of the gold standard.
+            rel_counts (np.ndarray): Integer array of shape (3, n_relations) with the same counts for the tokens
+                of each gold relation.
+        """
+        self.sentences = np.asarray(sentences, dtype=np.int64)
+        self.relations = relations
+        self.rel_counts = np.asarray(rel_counts, dtype=np.int64)
+
+    @property
+    def las(self):
+        return self.sentences[2].sum() / self.sentences[0].sum()
+
+    @property
+    def uas(self):
+        return self.sentences[1].sum() / self.sentences[0].sum()
+
+    def to_dict(self):
+        """Gets the counts as a dictionary that can be stored as JSON."""
+        return {"sentences": self.sentences.tolist(), "relations": self.relations, "rel_counts": self.rel_counts.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["sentences"], data["relations"], data["rel_counts"])
+
+class GoldStandard:
+
+    def __init__(self, path, punct=False):
+        """Reads the gold standard once into flat arrays that predictions are compared with.
+
+        Args:
+            path (str): Path of the gold conll file.
+            punct (bool, optional): Whether punctuation tokens are scored. Defaults to False.
+        """
+        sents = read_conll(path)
+        self.keys = list(sents)
+        self.words = [word for words, _, _ in sents.values() for word in words]
+        lengths = [len(words) for words, _, _ in sents.values()]
+        self.offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+        self.relations = sorted({rel for _, _, rels in sents.values() for rel in rels})
+        self.rel_ids = {rel: i for i, rel in enumerate(self.relations)}
+        self.heads = np.array([head for _, heads, _ in sents.values() for head in heads], dtype=np.int32)
+        self.rels = np.array([self.rel_ids[rel] for _, _, rels in sents.values() for rel in rels], dtype=np.int32)
+        if punct:
+            self.scored = np.ones(len(self.words), dtype=bool)
+        else:
+            self.scored = np.array([not is_punct(word) for word in self.words], dtype=bool)
+
+    def align(self, path):
+        """Reads the heads and relations of a prediction file in the order of the gold standard.
+
+        Args:
+            path (str): Path of the predicted conll file.
+
+        Raises:
+            ValueError: If a sentence is missing or its words are different from the gold standard.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Predicted head and relation id of every gold token.
+                Relations that do not occur in the gold standard have id -1.
+        """
+        sents = read_conll(path)
+        words, heads, rels = [], [], []
+        for key in self.keys:
+            if key not in sents:
+                raise ValueError("Sentence {} is missing in {}.".format(key, path))
+            sent_words, sent_heads, sent_rels = sents[key]
+            words.extend(sent_words)
+            heads.extend(sent_heads)
+            rels.extend(sent_rels)
+        if words != self.words:
+            raise ValueError("Sentence sequence of {} is not matched.".format(path))
+        return np.array(heads, dtype=np.int32), np.array([self.rel_ids.get(rel, -1) for rel in rels], dtype=np.int32)
+
+    def score(self, path):
+        """Computes the attachment scores of a prediction file."""
+        heads, rels = self.align(path)
+        correct_heads = heads == self.heads
+        counts = np.stack((self.scored, correct_heads & self.scored, correct_heads & (rels == self.rels) & self.scored))
+        cumulative = np.concatenate((np.zeros((3, 1), dtype=np.int64), np.cumsum(counts, axis=1)), axis=1)
+        sentences = cumulative[:, self.offsets[1:]] - cumulative[:, self.offsets[:-1]]
+        rel_counts = [np.bincount(self.rels, weights=row, minlength=len(self.relations)) for row in counts]
+        return Scores(sentences, self.relations, np.array(rel_counts, dtype=np.int64))
+
+def _init_worker(gold):
+    global _worker_gold
+    _worker_gold = gold
+
+def _evaluate(path):
+    """Scores a prediction file in a worker process and measures how long it took."""
+    start = time.perf_counter()
+    scores = _worker_gold.score(path)
+    return path, scores, time.perf_counter() - start
+
+def evaluate(gold, paths, workers=1):
+    """Scores prediction files, in parallel if there are several workers.
+
+    Args:
+        gold (GoldStandard): Gold standard the predictions are compared with.
+        paths (List[str]): Paths of the prediction files.
+        workers (int, optional): Number of worker processes. Defaults to 1.
+
+    Yields:
+        Tuple[str, Scores, float]: Path, scores and seconds it took for each file, in the order of paths.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        _init_worker(gold)
+        yield from map(_evaluate, paths)
+        return
+    with Pool(min(workers, len(paths)), initializer=_init_worker, initargs=(gold,)) as pool:
+        yield from pool.imap(_evaluate, paths)
+
+class ResultCache:
+
+    def __init__(self, path, refresh=False):
+        """Stores the scores of prediction files in a JSON-lines file, so unchanged files are not scored again.
+
+        Args:
+            path (str): Path of the JSON-lines file.
+            refresh (bool, optional): Whether stored scores are ignored and computed again. Defaults to False.
+        """
+        self.path = path
+        self.refresh = refresh
+        self.records = dict() # Key -> scores as dictionary.
+        self.changed = False
+        try:
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError: # E.g. the last line of an interrupted run.
+                        continue
+                    self.records[record["key"]] = record["scores"]
+        except OSError:
+            pass
+
+    @staticmethod
+    def key(gold_hash, pred_hash, punct):
+        """Gets the key of the scores of a prediction file, which only change if one of the arguments does."""
+        return "{}:{}:{}:{}".format(EVAL_VERSION, gold_hash, pred_hash, int(punct))
+
+    def get(self, key):
+        """Gets stored scores, None if there are none or they should be computed again."""
+        if self.refresh or key not in self.records:
+            return None
+        return Scores.from_dict(self.records[key])
+
+    def put(self, key, scores):
+        self.records[key] = scores.to_dict()
+        self.changed = True
+
+    def save(self):
+        """Writes all scores to the file if any were added."""
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp" # Written completely before it replaces the old file.
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for key, scores in self.records.items():
+                file.write(json.dumps({"key": key, "scores": scores}, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+def _resample_block(task):
+    """Computes the differences to the baseline for one block of resampled test sets.
+
+    Args:
+        task (tuple): Method, block seed, number of resamples, per-sentence counts of shape (n_sentences, 2 * n_files)
+            with the correct heads and labels of every file, scored tokens per sentence and index of the baseline file.
+
+    Returns:
+        np.ndarray: Array of shape (n_resamples, 2 * n_files) with the differences of UAS and LAS to the baseline.
+    """
+    method, seed, n_resamples, counts, tokens, baseline = task
+    rng = np.random.default_rng(seed)
+    n_files = counts.shape[1] // 2
+    n_sents = len(tokens)
+    base = counts[:, [baseline, n_files + baseline]]
+    if method == "bootstrap": # Every row says how often each sentence is drawn with replacement.
+        weights = rng.multinomial(n_sents, np.full(n_sents, 1 / n_sents), size=n_resamples)
+        scores = (weights @ counts) / (weights @ tokens)[:, None]
+        return scores - np.repeat(scores[:, [baseline, n_files + baseline]], n_files, axis=1)
+    # Approximate randomization: the outputs of a file and the baseline are swapped for random sentences.
+    diffs = counts - np.repeat(base, n_files, axis=1)
+    signs = rng.choice(np.array([-1, 1]), size=(n_resamples, n_sents))
+    return (signs @ diffs) / tokens.sum()
+
+def significance(results, baseline, method="bootstrap", n_resamples=10000, seed=SEED, workers=1, confidence=0.95):
+    """Tests whether the differences of every prediction file to the baseline are significant.
+
+    The test is paired: all files are resampled with the same sentences. Resamples are
+    drawn in blocks with seeds derived from seed, so the result does not depend on workers.
+
+    Args:
+        results (List[Tuple[str, Scores, float]]): Name and scores of every file.
+        baseline (str): Name of the baseline file.
+        method (str, optional): "bootstrap" or "randomization". Defaults to "bootstrap".
+        n_resamples (int, optional): Number of resampled test sets. Defaults to 10000.
+        seed (int, optional): Seed of the random number generator. Defaults to SEED.
+        workers (int, optional): Number of worker processes. Defaults to 1.
+        confidence (float, optional): Level of the bootstrap confidence intervals. Defaults to 0.95.
+
+    Raises:
+        ValueError: If there is no file with the name of the baseline.
+
+    Returns:
+        Dict[str, Tuple[float, float, tuple, float, float, tuple]]: For every file the difference of LAS to the baseline,
+            its p-value and confidence interval followed by the same for UAS. Intervals are None for randomization.
+    """
+    names = [name for name, _, _ in results]
+    if baseline not in names:
+        raise ValueError("There is no prediction file for the baseline {}.".format(baseline))
+    base_idx = names.index(baseline)
+    tokens = results[0][1].sentences[0]
+    counts = np.stack([scores.sentences[1] for _, scores, _ in results]
+                      + [scores.sentences[2] for _, scores, _ in results], axis=1)
+    observed = counts.sum(axis=0) / tokens.sum()
+    observed = observed - np.repeat(observed[[base_idx, len(names) + base_idx]], len(names))
+    blocks = [min(RESAMPLE_BLOCK, n_resamples - start) for start in range(0, n_resamples, RESAMPLE_BLOCK)]
+    tasks = [(method, (seed, i), size, counts, tokens, base_idx) for i, size in enumerate(blocks)]
+    if workers <= 1 or len(tasks) <= 1:
+        deltas = np.concatenate(list(map(_resample_block, tasks)))
+    else:
+        with Pool(min(workers, len(tasks))) as pool:
+            deltas = np.concatenate(pool.map(_resample_block, tasks))
+    if method == "bootstrap":
+        # Resampled differences are centered on the observed one, so they follow the distribution if there is no difference.
+        p_values = (np.abs(deltas - observed) >= np.abs(observed)).mean(axis=0)
+        tail = (1 - confidence) / 2 * 100
+        intervals = np.percentile(deltas, [tail, 100 - tail], axis=0).T
+    else:
+        p_values = ((np.abs(deltas) >= np.abs(observed) - 1e-12).sum(axis=0) + 1) / (len(deltas) + 1)
+        intervals = [None] * len(observed)
+    n_files = len(names)
+    return {name: (observed[n_files + i], p_values[n_files + i], intervals[n_files + i],
+                   observed[i], p_values[i], intervals[i])
+            for i, name in enumerate(names) if i != base_idx}
+
+def format_test(delta, p_value, interval):
+    """Formats a difference to the baseline with its p-value and confidence interval for the table."""
+    formatted = ["{:+.3f}".format(delta), "{:.4f}".format(p_value) if p_value >= 1e-4 else "<0.0001"]
+    if interval is not None:
+        formatted.append("[{:+.3f}, {:+.3f}]".format(*interval))
+    return formatted
+
+def prediction_files(pred_dir):
+    """Lists the prediction files of a directory, leaving out hidden files and subdirectories."""
+    return [os.path.join(pred_dir, name) for name in sorted(os.listdir(pred_dir))
+            if not name.startswith(".") and os.path.isfile(os.path.join(pred_dir, name))]
+
+def relation_table(results):
+    """Builds rows with the number of scored tokens and the LAS of every experiment for each gold relation."""
+    rows = []
+    first = results[0][1]
+    for rel_id in np.argsort(-first.rel_counts[0], kind="stable"):
+        n_tokens = first.rel_counts[0, rel_id]
+        if n_tokens == 0:
+            continue
+        rows.append([first.relations[rel_id], int(n_tokens)]
+                    + [round(scores.rel_counts[2, rel_id] / n_tokens, 3) for _, scores, _ in results])
+    return rows
+
 def main():
     parser = argparse.ArgumentParser(
                     prog='EvalPred',
@@ -31,9 +311,29 @@ def main():
     parser.add_argument('--gold', default="corpora/data-26k/de_gsd-ud-test.conllu")
     parser.add_argument("--pred_dir", default="predictions")
     parser.add_argument("--sort_by", choices=["name", "las", "uas"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--punct", action="store_true")
+    parser.add_argument("--relations", action="store_true")
+    parser.add_argument("--refresh", action="store_true")
+    parser.add_argument("--significance", choices=["bootstrap", "randomization"])
+    parser.add_argument("--baseline", default="baseline")
+    parser.add_argument("--resamples", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=SEED)
     args = parser.parse_args()
-    sent_gold = read_conll(args.gold)
-    pred_exps = os.listdir(args.pred_dir)
+    start = time.perf_counter()
+    pred_files = prediction_files(args.pred_dir)
+    cache = ResultCache(cache_path(args.gold, "eval.jsonl"), refresh=args.refresh)
+    gold_hash = file_hash(args.gold)
+    keys = {path: cache.key(gold_hash, file_hash(path), args.punct) for path in pred_files}
+    cached = {path: cache.get(key) for path, key in keys.items()}
+    missing = [path for path in pred_files if cached[path] is None]
+    scored = dict()
+    if missing: # The gold standard is only read if there is something to score.
+        gold = GoldStandard(args.gold, punct=args.punct)
+        for path, scores, seconds in evaluate(gold, missing, args.workers):
+            cache.put(keys[path], scores)
+            scored[path] = (scores, round(seconds, 3))
+        cache.save()
     sort_by = args.sort_by
     if sort_by == "name":
         sort_idx = 0
@@ -42,22 +342,28 @@ def main():
     else:
         sort_idx = 2
     results = []
-    for p_file in pred_exps:
-        sent_pred = read_conll(os.path.join(pred_path, p_file))
-        ordered_pred = []
-        ordered_gold = []
-        for key in sent_gold.keys():
-            ordered_gold.append(sent_gold[key])
-            ordered_pred.append(sent_pred[key])
-        eval_dep = DependencyEvaluator(ordered_pred, ordered_gold)
-        las, uas = eval_dep.eval()
-        results.append((p_file.removesuffix(".conll"), round(las, 3), round(uas, 3)))
+    for path in pred_files:
+        name = os.path.basename(path).removesuffix(".conll")
+        results.append((name, *scored.get(path, (cached[path], "cached"))))
+    table = [[name, round(scores.las, 3), round(scores.uas, 3), seconds] for name, scores, seconds in results]
+    headers = ["Experiment", "LAS", "UAS", "Seconds"]
+    if args.significance is not None and results:
+        tests = significance(results, args.baseline, args.significance, args.resamples, args.seed, args.workers)
+        for row in table:
+            if row[0] in tests:
+                las_test, uas_test = tests[row[0]][:3], tests[row[0]][3:]
+                row.extend(format_test(*las_test) + format_test(*uas_test))
+        interval = ["95% CI"] if args.significance == "bootstrap" else []
+        headers += ["ΔLAS", "p"] + interval + ["ΔUAS", "p"] + interval
 
-    sort_res = sorted(results, key=lambda x: x[sort_idx], reverse=True)
+    sort_res = sorted(table, key=lambda x: x[sort_idx], reverse=True)
 
-    print(tabulate(sort_res, headers=["Experiment", "LAS", "UAS"]))
+    print(tabulate(sort_res, headers=headers, disable_numparse=list(range(4, len(headers))))) # Keep the signs of the differences.
+    if args.relations and results:
+        print()
+        print(tabulate(relation_table(results), headers=["Relation", "Tokens"] + [name for name, _, _ in results]))
+    print("\nScored {} files and took {} from the cache in {:.3f}s.".format(
+        len(scored), len(results) - len(scored), time.perf_counter() - start))
 
 if __name__ == "__main__":
     main()
-        
-
@@ -1,20 +1,84 @@
 import argparse
+from contextlib import ExitStack, nullcontext
+import cProfile
+import json
 import os
-from random import seed
+import tracemalloc
 
+from tabulate import tabulate
 from tqdm import tqdm
 import yaml
 
-from augment.augment import Augment
-from augment.data import Corpus
+from augment.augment import Augment, SEED
+from augment.data import ConllWriter, Corpus, ShardedWriter
+from augment.dedup import FingerprintSet
+from augment.instrument import Profiler
+from augment.manifest import Manifest, code_version, experiment_key
+from augment.pipeline import QUEUE_SIZE, Budget, Plan, augment_budget, augment_corpus, augment_pipelined
 
-seed(1704)
+SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"} # File endings for compressed output.
+
+def report_profile(profiler, setup, passes, out_dir):
+    """Prints the statistics of the shared stages and the tasks of every experiment and writes them to profile.json.
+
+    Args:
+        profiler (Profiler): Profiler of the run.
+        setup (dict): Statistics of reading the corpus and everything else before the first pass, see Profiler.split.
+        passes (List[Tuple[dict, dict]]): Statistics of every pass over the corpus, with the task keys of each
+            experiment that was run in it. Stages that are not tasks are shared by all experiments of a pass.
+        out_dir (str): Output directory with a subdirectory for every experiment.
+    """
+    for stats, experiments in passes:
+        tasks = {key for keys in experiments.values() for key in keys}
+        stats = profiler.combine(setup, stats)
+        shared = [name for name in stats if name not in tasks]
+        for exp_name, keys in experiments.items():
+            rows = profiler.summary(shared + keys, stats)
+            print(f"Profile of configuration '{exp_name}':")
+            print(tabulate([(row["stage"], row["calls"], round(row["seconds"], 3), row["net_retained_blocks"]) for row in rows],
+                           headers=["Stage", "Calls", "Seconds", "Net retained blocks"]))
+            with open(os.path.join(out_dir, exp_name, "profile.json"), "w", encoding="utf-8") as file:
+                json.dump({"experiment": exp_name, "stages": rows}, file, indent=2)
+
+def positive_int(value):
+    """Parses a command line argument that must be an integer of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}".format(value))
+    return number
 
 def main():
     parser = argparse.ArgumentParser(
                     prog='AugmentDepData',
                     description='Augmenting data for dependency parsing.')
     parser.add_argument('--config', default="experiments.yaml")
+    parser.add_argument('--stream', action="store_true",
+                        help="Read the input file lazily instead of keeping it in memory.")
+    parser.add_argument('--cache', action="store_true",
+                        help="Load the input from a binary cache next to it, the cache is created if needed.")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes that augment sentences in parallel.")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--compress', choices=["gzip", "zstd"],
+                        help="Compress the output files.")
+    parser.add_argument('--shards', type=positive_int,
+                        help="Split the output of every experiment into this many shards with about the same number of tokens.")
+    parser.add_argument('--plain', action="store_true",
+                        help="Only write token lines, without comments, multiword tokens and empty nodes.")
+    parser.add_argument('--dedup', action="store_true",
+                        help="Leave out augmented sentences that are equal to any input sentence or earlier augmented sentence.")
+    parser.add_argument('--force', action="store_true",
+                        help="Run all experiments, also those whose output is up to date according to the manifest.")
+    parser.add_argument('--pipeline', action="store_true",
+                        help="Read, augment and write at the same time in separate threads.")
+    parser.add_argument('--queue_size', type=positive_int, default=QUEUE_SIZE,
+                        help="Maximum number of chunks of sentences that wait between two stages of the pipeline.")
+    parser.add_argument('--profile', action="store_true",
+                        help="Measure time, calls and net retained memory blocks of every stage and task.")
+    parser.add_argument('--cprofile', action="store_true",
+                        help="Run with cProfile and write the statistics to profile.prof in the output directory.")
+    parser.add_argument('--tracemalloc', action="store_true",
+                        help="Trace memory allocations and write the largest ones to tracemalloc.txt in the output directory.")
     args = parser.parse_args()
     CONFIG = args.config
     with open(CONFIG, encoding="utf-8") as cfg:
@@ -32,46 +96,137 @@ def main():
     # Get input file
     in_file = config_dict["input"]
 
+    # Experiments that were completed with the same input, parameters, seed, options and code are skipped.
+    manifest = Manifest(out_dir)
+    input_hash = manifest.input_hash(in_file)
+    code = code_version([__file__])
+    out_file = "augmented.conll" + SUFFIXES[args.compress] if args.shards is None else "shards.json"
+    keys = dict()
+    for exp_name, exp_config in experiments.items():
+        options = {"compress": args.compress, "plain": args.plain, "dedup": args.dedup, "shards": args.shards}
+        if "budget" in exp_config: # A streamed corpus is augmented in file order instead of by priority.
+            options["stream"] = args.stream
+        keys[exp_name] = experiment_key(input_hash, exp_config, args.seed, options, code)
+    if not args.force:
+        for exp_name in experiments:
+            if manifest.is_current(exp_name, keys[exp_name]):
+                n = manifest.experiments[exp_name]["n_augmented"]
+                print(f"Skipping unchanged configuration '{exp_name}' with {n} generated sentences.")
+        experiments = {name: config for name, config in experiments.items() if not manifest.is_current(name, keys[name])}
+    manifest.invalidate(experiments) # Their output is overwritten, so it is no longer complete.
+    if len(experiments) == 0:
+        print("All configurations are up to date, use --force to run them again.")
+        return
+
+    # Profiling replaces functions by measuring wrappers, nothing is changed if it is disabled.
+    profiler = Profiler().__enter__() if args.profile else None
+    stage = profiler.stage if profiler is not None else lambda name: nullcontext()
+    workers = args.workers
+    if profiler is not None and workers > 1:
+        print("Profiling measures a single process, --workers is ignored.")
+        workers = 1
+    if args.tracemalloc:
+        tracemalloc.start()
+    if args.cprofile:
+        cprofiler = cProfile.Profile()
+        cprofiler.enable()
+
     # Initiate corpus and augmentation instances.
     path_train = os.path.join(in_file)
-    corpus = Corpus(path_train)
-    augment = Augment(corpus)
+    with stage("read"):
+        corpus = Corpus(path_train, stream=args.stream, cache=args.cache)
+    with stage("setup"):
+        corpus.statistics(workers=workers) # Collected in one pass, by several processes if there are workers.
+        augment = Augment(corpus, seed=args.seed)
 
     n_token = corpus.n_tokens()
     print("Number of token in input data: ", n_token)
     print("Number of sentences in input data: ", len(corpus))
 
-    for exp_name in experiments:
-        aug_sent_dict = dict()
-        # Get all augmentation techniques to apply.
-        augment_config = experiments[exp_name]
-        rotate_kwargs = augment_config.get("rotate", False)
-        crop_kwargs = augment_config.get("crop", False)
-        nonce_kwargs = augment_config.get("nonce", False)
-        n_augmented = 0 # Number of augmented sentences.
-        # For each sentence, generate new augmented data:
-        for sent in tqdm(corpus, desc=f"Augmenting for configuration '{exp_name}'"):
-            augs = set()
-            if rotate_kwargs is not False:
-                rotation_sents = augment.generate_rotations(sentence=sent, **rotate_kwargs)
-                augs.update(rotation_sents)
-            if crop_kwargs is not False:
-                crop_sents = augment.generate_crops(sentence=sent, **crop_kwargs)
-                augs.update(crop_sents)
-            if nonce_kwargs is not False:
-                nonce_sents = augment.generate_nonce(sentence=sent, **nonce_kwargs)
-                augs.update(nonce_sents)
-            if sent in augs: # Avoid writing the same sentence twice to the output.
-                augs.remove(sent)
-            aug_sent_dict[sent] = augs
-            n_augmented += len(augs)
-        print(f"Generated {n_augmented} sentences, {round(n_augmented/len(corpus), ndigits=2)} on average per input sentence.")
-        out_exp_dir = os.path.join(out_dir, exp_name)
-        # Write to output dir.
-        if not os.path.exists(out_exp_dir): 
-            os.mkdir(out_exp_dir)
-        out_path = os.path.join(out_exp_dir, "augmented.conll")
-        augment.write(aug_sent_dict, out_path)
-            
+    # Experiments with a budget visit the sentences in their own order, the others share a single pass.
+    budgets = {name: Budget(config) for name, config in experiments.items() if "budget" in config}
+    # Identical techniques of different experiments are only run once.
+    plan = Plan({name: config for name, config in experiments.items() if name not in budgets},
+                comments=not args.plain)
+    plan.profiler = profiler
+    for budget in budgets.values():
+        budget.profiler = profiler
+    print(f"Running {len(plan.tasks)} augmentation tasks for {len(plan.experiments)} configurations.")
+    n_augmented = dict.fromkeys(experiments, 0) # Number of augmented sentences per experiment.
+    seen = None
+    if args.dedup: # Fingerprints of all input sentences, extended by the output of each experiment.
+        originals = FingerprintSet(2 * len(corpus))
+        for sent in corpus:
+            originals.add(sent.fingerprint)
+        seen = {exp_name: originals.copy() for exp_name in experiments}
+    with ExitStack() as stack:
+        writers = dict()
+        for exp_name in experiments:
+            out_exp_dir = os.path.join(out_dir, exp_name)
+            if not os.path.exists(out_exp_dir): 
+                os.mkdir(out_exp_dir)
+            if args.shards is None:
+                writer = ConllWriter(os.path.join(out_exp_dir, out_file))
+            else:
+                writer = ShardedWriter(out_exp_dir, args.shards, SUFFIXES[args.compress])
+            writers[exp_name] = stack.enter_context(writer)
+        def write(sent_results):
+            for exp_name, sents in sent_results.items():
+                if seen is not None: # The input sentence is always kept.
+                    sents = sents[:1] + [sent for sent in sents[1:] if seen[exp_name].add(sent[0])]
+                writers[exp_name].write_sentences([(technique, text) for _, technique, text in sents])
+                n_augmented[exp_name] += len(sents) - 1
+        # Every pass over the corpus is profiled separately, so the shared stages of a pass only count for its experiments.
+        setup = profiler.split() if profiler is not None else None
+        passes = []
+        # For each sentence, generate new augmented data for all experiments and write it to the output dirs right away:
+        if args.pipeline:
+            with tqdm(total=len(corpus), desc="Augmenting") as progress:
+                def consume(sent_results):
+                    write(sent_results)
+                    progress.update()
+                counters = augment_pipelined(augment, corpus, plan, consume, seed=args.seed, workers=workers,
+                                             queue_size=args.queue_size)
+            rows = [counter.summary() for counter in counters]
+            print(tabulate(rows, headers={"stage": "Stage", "sentences": "Sentences", "seconds": "Busy seconds",
+                                          "sentences_per_s": "Sentences/s", "mean_queue_depth": "Mean queue",
+                                          "max_queue_depth": "Max queue"}, floatfmt=".2f"))
+        else:
+            results = augment_corpus(augment, corpus, plan, seed=args.seed, workers=workers)
+            for sent_results in tqdm(results, total=len(corpus), desc="Augmenting"):
+                write(sent_results)
+        if profiler is not None:
+            passes.append((profiler.split(), plan.experiments))
+        for exp_name, budget in budgets.items():
+            exp_seen = seen[exp_name] if seen is not None else None
+            results = augment_budget(augment, corpus, budget, seed=args.seed, comments=not args.plain, seen=exp_seen)
+            for sents in tqdm(results, total=len(corpus), desc=f"Budget of '{exp_name}'"):
+                writers[exp_name].write_sentences(sents)
+                n_augmented[exp_name] += len(sents) - 1
+            used = ", ".join(f"{technique} {budget.used[technique]}/{quota}" for technique, quota in budget.quotas.items())
+            print(f"Used budget of '{exp_name}' in {budget.unit}: {used}.")
+            if profiler is not None:
+                passes.append((profiler.split(), {exp_name: list(budget.keys.values())}))
+    for exp_name, n in n_augmented.items():
+        manifest.record(exp_name, keys[exp_name], out_file, n)
+    manifest.save()
+    for exp_name, n in n_augmented.items():
+        print(f"Generated {n} sentences for configuration '{exp_name}', {round(n/len(corpus), ndigits=2)} on average per input sentence.")
+    # All experiments share one pass, so cProfile and tracemalloc cover all of them.
+    if args.cprofile:
+        cprofiler.disable()
+        cprofiler.dump_stats(os.path.join(out_dir, "profile.prof"))
+    if args.tracemalloc:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        with open(os.path.join(out_dir, "tracemalloc.txt"), "w", encoding="utf-8") as file:
+            file.write(f"Peak traced memory: {peak / 2**20:.1f} MB\n")
+            for statistic in snapshot.statistics("lineno")[:50]:
+                file.write(f"{statistic}\n")
+    if profiler is not None:
+        profiler.restore()
+        report_profile(profiler, setup, passes, out_dir)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file